@@ -1,6 +1,9 @@
 import cv2
 import numpy as np
+from functools import lru_cache
 from pathlib import Path
+from scipy.spatial import cKDTree
+from frame_sources import FrameSource, FolderFrameSource
 
 
 PIXEL_TO_MM_RATIO = 16
@@ -9,6 +12,24 @@ LARGE_DISK_RADIUS = 3.5 # mm
 TOTAL_SYSTEM_RADIUS = 90 # 84 # mm
 TOTAL_SYSTEM_AREA = np.pi * TOTAL_SYSTEM_RADIUS**2 # mm^2
 
+# Incremental detection (Detector.detect_disks_incremental)
+TRACK_SEARCH_RADIUS = 0.5 * SMALL_DISK_RADIUS * PIXEL_TO_MM_RATIO # pixels, max displacement of a tracked disk between two frames
+TRACK_ITERATIONS = 3 # centroid steps per tracked disk
+TRACK_MIN_FILL = 0.6 # min fraction of white pixels inside a tracked disk, below it the disk is lost
+NEW_DISK_MIN_FILL = 0.5 # min white area (in small disks) of an uncovered region to look for new disks in it
+MAX_LOST_FRACTION = 0.25 # above this fraction of lost disks the frame is detected from scratch
+
+# Pyramid detection (Detector.detect_disks_pyramid): scale -> reduced size JPEG decode flag
+REDUCED_GRAYSCALE_READ_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+}
+
+# Detection engines: "hough" votes circles on the edges, "blob" reads them from the distance transform of the white disks
+DETECTION_ENGINES = ("hough", "blob")
+DETECTION_VERSION = 2 # bump when a change to the detection code changes its results, so saved results are recomputed
+BLOB_MIN_PEAK_FRACTION = 0.7 # min distance transform peak, as a fraction of the small disk radius
+
 
 def get_frame_size(frame):
     if len(frame.shape) == 2:
@@ -18,6 +39,15 @@ def get_frame_size(frame):
     return frame_height, frame_width
 
 
+@lru_cache(maxsize=None)
+def disk_footprint(radius: int) -> np.ndarray:
+    """Filled disk of the given radius (255 inside) on a (2 * radius + 1) square uint8 image."""
+    footprint = np.zeros((2 * radius + 1, 2 * radius + 1), dtype=np.uint8)
+    cv2.circle(footprint, (radius, radius), radius, 255, -1)
+    footprint.setflags(write=False)
+    return footprint
+
+
 def show_preview(image, window_name="preview", wait=True):
     height, width  = get_frame_size(image)
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
@@ -98,31 +128,79 @@ class Configuration:
     
     def get_center_disk_shifts(self):
         return self.center_disk.get_center_x_shift(), self.center_disk.get_center_y_shift()
+
+    def get_key(self):
+        """Hashable key of every parameter that shapes the crop masks and the black and white threshold."""
+        return (self.width_shift, self.height_shift, self.image_scale_factor, self.mask_thresh,
+                self.get_center_disk_radius(), *self.get_center_disk_shifts())
     
 
+# (configuration key, frame height, frame width, scale) -> (roi, keep mask, invert mask), shared by all detectors of a process
+_ANNULUS_MASKS_CACHE = {}
+ROI_MARGIN = 2 # pixels of black border kept around the outer crop circle, so its edge is not on the ROI border
+HOUGH_DP = 1.2 # HoughCircles accumulator cell, in pixels
+ROI_ALIGNMENT = 6 # pixels, the period of the HOUGH_DP accumulator grid (5 cells), the ROI starts on it
+
+
 class Detector:
-    def __init__(self, measure_raw_data_path: Path, frame_name: str, configure: Configuration):
+    def __init__(self, measure_raw_data_path: Path, frame_name: str, configure: Configuration, headless: bool = False, engine: str = "hough",
+                 frame_source: FrameSource = None):
+        """
+        @param headless: decode the frames straight to grayscale, for batch jobs that never draw on the frame
+        @param engine: circles detection engine, one of DETECTION_ENGINES
+        @param frame_source: where the frames are decoded from, defaults to the folder measure_raw_data_path
+        """
         self.configure = configure
         self.measure_raw_data_path = measure_raw_data_path
+        self.frame_source = frame_source if frame_source is not None else FolderFrameSource(measure_raw_data_path)
         self.frame_name = frame_name
         self.frame_path = (self.measure_raw_data_path / self.frame_name).resolve()
+        self.headless = headless
+        self.set_engine(engine)
         self.small_disk_radius = SMALL_DISK_RADIUS * PIXEL_TO_MM_RATIO
         self.large_disk_radius = LARGE_DISK_RADIUS * PIXEL_TO_MM_RATIO
+        self.frame_height = self.frame_width = None
         self.reset()
         
-    def reset(self):
+    def reset(self, image=None):
+        """
+        @param image: the frame already decoded with get_read_flag(), or None to read it from the frame source on first use
+        (see get_image), so a detection on the reduced frame alone never decodes it in full
+        """
         self.circles = np.empty(1)
-        self.image = cv2.imread(str(self.frame_path), cv2.IMREAD_COLOR)
-        if self.image is None:
-            raise FileNotFoundError(f"Detector.reset() Could not read the image at {self.frame_path}.")
-        self.frame_height, self.frame_width = get_frame_size(self.image)
+        self.black_white_image = None
+        self.image = image
+        # sources of cropped frames (memory mapped stacks) give the full frame shape and the crop position
+        self.image_origin = self.frame_source.get_origin()
+        frame_shape = self.frame_source.get_frame_shape()
+        if frame_shape is None and (image is not None or self.frame_height is None):
+            frame_shape = get_frame_size(self.get_image())
+        if frame_shape is not None: # otherwise the frame is not decoded yet, and has the size of the previous frames of the source
+            self.frame_height, self.frame_width = frame_shape
         self.frame_center = (self.frame_width // 2 + self.configure.get_width_shift(),  self.frame_height // 2 + self.configure.get_height_shift())
     
     def get_configure(self):
         return self.configure
 
+    def get_frame_source(self):
+        return self.frame_source
+
+    def get_image(self):
+        """
+        @return: the current frame, decoded with get_read_flag() on first use
+        """
+        if self.image is None:
+            self.image = self.frame_source.read(self.frame_name, self.get_read_flag())
+        return self.image
+
+    def get_read_flag(self):
+        """
+        @return: cv2.imread flags the frames of this detector are decoded with
+        """
+        return cv2.IMREAD_GRAYSCALE if self.headless else cv2.IMREAD_COLOR
+
     def get_frame_name(self):
-        return self.frame_name()
+        return self.frame_name
     
     def get_frame_sizes(self):
         return self.frame_height, self.frame_width
@@ -141,23 +219,200 @@ class Detector:
     
     def get_frame_center(self):
         return self.frame_center
+
+    def get_engine(self):
+        return self.engine
+
+    def set_engine(self, engine: str):
+        if engine not in DETECTION_ENGINES:
+            raise ValueError(f"Detector.set_engine() engine must be one of {DETECTION_ENGINES}, got {engine}.")
+        self.engine = engine
     
-    def set_frame(self, new_frame_name: str):
+    def set_frame(self, new_frame_name: str, image=None):
+        """
+        @param image: the frame already decoded with get_read_flag() (see prefetch_frames), or None to read it
+        """
         self.frame_name = new_frame_name
         self.frame_path = (self.measure_raw_data_path / new_frame_name).resolve()
-        self.reset()
+        self.reset(image)
+
+    def get_roi(self):
+        """
+        Get the bounding box of the outer crop circle (with room for the circles centered just outside it, and starting
+        on the HoughCircles grid period ROI_ALIGNMENT), the only part of the frame the detection looks at.
 
-    def _detect_circles(self, frame):
+        Returns:
+            tuple: (x0, y0, x1, y1) in pixels of the full frame, x1 and y1 exclusive.
+        """
+        return self._get_annulus_masks()[0]
+
+    def _hough_circles(self, frame, scale=1):
+        """
+        @param frame: black and white image to run HoughCircles on
+        @param scale: the frame is reduced by this factor, the disks radii are scaled accordingly
+        @return: (N, 3) int32 array of [x, y, radius] in the frame's pixels, or None if no circle was found
+        """
         sensitivity = 8
-        circles = cv2.HoughCircles(frame, cv2.HOUGH_GRADIENT, dp=1.2, 
-            minDist=self.small_disk_radius * 2, 
+        circles = cv2.HoughCircles(frame, cv2.HOUGH_GRADIENT, dp=HOUGH_DP, 
+            minDist=self.small_disk_radius * 2 / scale, 
             param1=50, 
             param2=sensitivity, 
-            minRadius=int(self.small_disk_radius), 
-            maxRadius= int(self.large_disk_radius))
+            minRadius=int(self.small_disk_radius / scale), 
+            maxRadius= int(self.large_disk_radius / scale))
+        if circles is None:
+            return None
+        return circles[0].astype(np.int32)
+
+    def _blob_circles(self, frame, scale=1):
+        """
+        Find the disks as peaks of the distance transform of the white pixels, in one linear pass instead
+        of a Hough vote. Touching disks merge into one white blob but keep a distance peak each, so
+        the blob is split by its peaks. A blob with a single peak gets its equivalent radius
+        (sqrt(area / pi)), the disks of a split blob get their peak's distance.
+
+        @param frame: black and white image
+        @param scale: the frame is reduced by this factor, the disks radii are scaled accordingly
+        @return: (N, 3) int32 array of [x, y, radius] in the frame's pixels, or None if no circle was found
+        """
+        small_radius, large_radius = self.small_disk_radius / scale, self.large_disk_radius / scale
+        distances = cv2.distanceTransform(frame, cv2.DIST_L2, 5)
+        kernel_size = 2 * int(small_radius) + 1
+        local_max = cv2.dilate(distances, cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size)))
+        peaks = ((distances >= local_max) & (distances >= BLOB_MIN_PEAK_FRACTION * small_radius)).astype(np.uint8)
+        # a flat top gives a few adjacent peak pixels, keep their centroid
+        peaks_num, _, _, peaks_centroids = cv2.connectedComponentsWithStats(peaks, connectivity=8)
+        if peaks_num < 2:
+            return None
+        centers = np.rint(peaks_centroids[1:]).astype(np.int32)
+        peak_radii = distances[centers[:, 1], centers[:, 0]]
+
+        # like HoughCircles minDist, keep the strongest of peaks closer than a small disk diameter,
+        # each kept peak suppresses its neighbours (strictly closer than the diameter) found on a tree
+        neighbours = cKDTree(centers).query_ball_point(centers, np.nextafter(2 * small_radius, 0))
+        kept = np.zeros(len(centers), dtype=bool)
+        suppressed = np.zeros(len(centers), dtype=bool)
+        for i in np.argsort(-peak_radii):
+            if not suppressed[i]:
+                kept[i] = True
+                suppressed[neighbours[i]] = True
+        centers, peak_radii = centers[kept], peak_radii[kept]
+
+        _, labels, stats, _ = cv2.connectedComponentsWithStats(frame, connectivity=8)
+        blob_labels = labels[centers[:, 1], centers[:, 0]]
+        peaks_per_blob = np.bincount(blob_labels, minlength=len(stats))
+        single = peaks_per_blob[blob_labels] == 1
+        radii = np.where(single, np.sqrt(stats[blob_labels, cv2.CC_STAT_AREA] / np.pi), peak_radii)
+        radii = np.clip(np.rint(radii), int(small_radius), int(large_radius))
+        return np.column_stack([centers, radii]).astype(np.int32)
+
+    def _find_circles(self, frame, scale=1):
+        """
+        @param frame: black and white image
+        @param scale: the frame is reduced by this factor
+        @return: (N, 3) int32 array of [x, y, radius] found by the detector's engine, or None
+        """
+        if self.engine == "blob":
+            return self._blob_circles(frame, scale)
+        return self._hough_circles(frame, scale)
+
+    def _set_circles(self, circles, offset=(0, 0)):
+        """
+        @param circles: (N, 3) array of [x, y, radius] relative to offset
+        @param offset: (x, y) of the circles' frame top left corner in the full frame
+        """
+        self.circles = circles.astype(np.int32)[np.newaxis]
+        self.circles[0, :, 0] += offset[0]
+        self.circles[0, :, 1] += offset[1]
+
+    def _detect_circles(self, frame, offset=(0, 0)):
+        """
+        @param frame: black and white image to run the detection engine on
+        @param offset: (x, y) of the frame's top left corner in the full frame, added to the detected centers
+        """
+        circles = self._find_circles(frame)
         if circles is None:
             raise ValueError(f"Detector._detect_circles() No circles were detected in the frame {self.frame_name}.")
-        self.circles = circles.astype(np.int32)
+        self._set_circles(circles, offset)
+
+    def _relocalise_circles(self, frame, circles):
+        """
+        Move each circle to the centroid of the white pixels it covers, a few steps, like a mean shift.
+
+        Parameters:
+            frame (numpy.ndarray): black and white image the circles are given in.
+            circles (numpy.ndarray): (N, 3) int array of [x, y, radius] of the previous frame.
+
+        Returns:
+            tuple: (N, 3) int32 array of the relocalised circles and an (N,) bool array of the ones still tracked.
+        """
+        frame_height, frame_width = frame.shape
+        relocalised = circles.astype(np.int32)
+        tracked = np.zeros(len(circles), dtype=bool)
+        for i, (x, y, radius) in enumerate(circles):
+            footprint = disk_footprint(int(radius))
+            footprint_area = np.count_nonzero(footprint)
+            center_x, center_y, fill = float(x), float(y), 0.0
+            for _ in range(TRACK_ITERATIONS):
+                x0, y0 = int(round(center_x)) - radius, int(round(center_y)) - radius
+                x1, y1 = x0 + footprint.shape[1], y0 + footprint.shape[0]
+                clipped_x0, clipped_y0 = max(x0, 0), max(y0, 0)
+                clipped_x1, clipped_y1 = min(x1, frame_width), min(y1, frame_height)
+                if clipped_x1 <= clipped_x0 or clipped_y1 <= clipped_y0:
+                    break
+                patch = cv2.bitwise_and(frame[clipped_y0:clipped_y1, clipped_x0:clipped_x1],
+                                        footprint[clipped_y0 - y0:clipped_y1 - y0, clipped_x0 - x0:clipped_x1 - x0])
+                moments = cv2.moments(patch, binaryImage=True)
+                if moments["m00"] == 0:
+                    break
+                center_x = clipped_x0 + moments["m10"] / moments["m00"]
+                center_y = clipped_y0 + moments["m01"] / moments["m00"]
+                fill = moments["m00"] / footprint_area
+            displacement = np.hypot(center_x - x, center_y - y)
+            tracked[i] = fill >= TRACK_MIN_FILL and displacement <= TRACK_SEARCH_RADIUS
+            relocalised[i, :2] = round(center_x), round(center_y)
+        return relocalised, tracked
+
+    def _detect_uncovered_circles(self, frame, circles):
+        """
+        Run the detection engine only around the white regions of the frame that no given circle covers,
+        which is where disks were lost or new disks appeared.
+
+        Parameters:
+            frame (numpy.ndarray): black and white image.
+            circles (numpy.ndarray): (N, 3) int array of [x, y, radius] of the already found disks.
+
+        Returns:
+            numpy.ndarray: (M, 3) int32 array of the new circles found, in the frame's pixels.
+        """
+        frame_height, frame_width = frame.shape
+        uncovered = frame.copy()
+        for x, y, radius in circles:
+            cv2.circle(uncovered, (int(x), int(y)), int(radius) + 2, 0, -1)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(uncovered, connectivity=8)
+        min_area = NEW_DISK_MIN_FILL * np.pi * self.small_disk_radius**2
+        margin = int(self.large_disk_radius)
+        known_centers = circles[:, :2]
+        new_circles = []
+        for left, top, width, height, area in stats[1:]: # label 0 is the background
+            if area < min_area:
+                continue
+            x0, y0 = max(left - margin, 0), max(top - margin, 0)
+            x1, y1 = min(left + width + margin, frame_width), min(top + height + margin, frame_height)
+            found = self._find_circles(frame[y0:y1, x0:x1])
+            if found is None:
+                continue
+            found[:, 0] += x0
+            found[:, 1] += y0
+            # keep only circles centered in the uncovered region, away from the known disks
+            inside = (left <= found[:, 0]) & (found[:, 0] < left + width) & (top <= found[:, 1]) & (found[:, 1] < top + height)
+            found = found[inside]
+            if len(known_centers) and len(found):
+                distances = np.linalg.norm(found[:, np.newaxis, :2] - known_centers[np.newaxis], axis=2).min(axis=1)
+                found = found[distances >= self.small_disk_radius * 2]
+            if len(found):
+                new_circles.append(found)
+                known_centers = np.vstack([known_centers, found[:, :2]])
+        return np.vstack(new_circles) if new_circles else np.empty((0, 3), dtype=np.int32)
 
     def _create_outer_crop_mask(self):
         outer_crop_center = self.frame_center
@@ -188,7 +443,7 @@ class Detector:
     
     def _draw_circles(self, frame):
         if self.circles is not None:
-            centers = self.circles[0][:, :2]  # First two columns: x, y
+            centers = self.circles[0][:, :2] - np.array(self.image_origin, dtype=np.int32)  # First two columns: x, y, in the decoded frame
             radii = self.circles[0][:, 2] # Circle radius
 
             for center, radius in zip(centers, radii):
@@ -247,27 +502,69 @@ class Detector:
         }
         return statistics
 
-    def detect_disks(self, test_mode=False, show_control_print=False, print_stat=False):
-        # Load the image
-        image = np.copy(self.image)
-        if show_control_print: print(f"\nimage loaded: {self.frame_name}\n")
+    def _get_gray(self):
+        image = self.get_image()
+        if len(image.shape) == 2:
+            return image # headless detectors decode straight to grayscale
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
-        # Convert the image to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        if show_control_print: print("converted to grayscale\n")
-        if test_mode: show_preview(gray)
+    def _get_annulus_masks(self, scale=1):
+        """
+        Get the crop masks of the ring, built once per configuration and frame size.
 
-        # crop the outer frame
-        outer_mask, outer_crop_center, outer_crop_radius = self._create_outer_crop_mask()
-        cv2.circle(outer_mask, outer_crop_center, outer_crop_radius, 255, -1)
-        
-        # crop center disk
-        center_disk_mask, center_disk_center, center_disk_radius = self._create_inner_mask()
-        cv2.circle(center_disk_mask, center_disk_center, int(center_disk_radius), 255, -1)
-        
-        # Apply the mask to isolate the region inside the ring
-        masked_gray_image = cv2.bitwise_and(gray, gray, mask=outer_mask)
-        masked_gray_image = cv2.bitwise_not(masked_gray_image, masked_gray_image, mask=center_disk_mask)
+        Parameters:
+            scale (int): masks of the frame reduced by this factor, as decoded with REDUCED_GRAYSCALE_READ_FLAGS.
+
+        Returns:
+            tuple: (roi, keep_mask, invert_mask). roi is the (x0, y0, x1, y1) bounding box of the outer crop circle, see get_roi,
+            and both masks are uint8 images of the roi. keep_mask is 255 inside the outer crop circle,
+            invert_mask is 255 inside the center disk, so the masked roi is (gray & keep_mask) ^ invert_mask.
+        """
+        key = (self.configure.get_key(), self.frame_height, self.frame_width, scale)
+        if key not in _ANNULUS_MASKS_CACHE:
+            # crop the outer frame
+            keep_mask, (x, y), outer_crop_radius = self._create_outer_crop_mask()
+            cv2.circle(keep_mask, (x, y), outer_crop_radius, 255, -1)
+
+            # crop center disk
+            invert_mask, center_disk_center, center_disk_radius = self._create_inner_mask()
+            cv2.circle(invert_mask, center_disk_center, int(center_disk_radius), 255, -1)
+
+            frame_height, frame_width = self.frame_height, self.frame_width
+            # circles can be centered up to a large disk radius outside the crop circle, voted by its edge
+            margin = outer_crop_radius + int(self.large_disk_radius) + ROI_MARGIN
+            if scale != 1:
+                # reduced decodes round the frame size up
+                frame_height, frame_width = -(-frame_height // scale), -(-frame_width // scale)
+                keep_mask = cv2.resize(keep_mask, (frame_width, frame_height), interpolation=cv2.INTER_NEAREST)
+                invert_mask = cv2.resize(invert_mask, (frame_width, frame_height), interpolation=cv2.INTER_NEAREST)
+                x, y, margin = x // scale, y // scale, -(-margin // scale)
+
+            # Everything outside the outer crop circle is black, so keep only its bounding box. HoughCircles votes
+            # on a grid that depends on the image origin, so the box starts on the grid period to detect the
+            # same circles as the whole frame.
+            x0 = max(x - margin, 0) // ROI_ALIGNMENT * ROI_ALIGNMENT
+            y0 = max(y - margin, 0) // ROI_ALIGNMENT * ROI_ALIGNMENT
+            roi = (x0, y0, min(x + margin + 1, frame_width), min(y + margin + 1, frame_height))
+            x0, y0, x1, y1 = roi
+            keep_mask = np.ascontiguousarray(keep_mask[y0:y1, x0:x1])
+            invert_mask = np.ascontiguousarray(invert_mask[y0:y1, x0:x1])
+            keep_mask.setflags(write=False)
+            invert_mask.setflags(write=False)
+            _ANNULUS_MASKS_CACHE[key] = (roi, keep_mask, invert_mask)
+        return _ANNULUS_MASKS_CACHE[key]
+
+    def _create_black_white_image(self, gray, test_mode=False, show_control_print=False, scale=1):
+        """
+        @param gray: grayscale frame, as decoded by the frame source (cropped frames start at self.image_origin)
+        @param scale: the frame is reduced by this factor (reduced reads are whole frames)
+        @return: black and white image of the roi (see get_roi)
+        """
+        # Apply the cached masks to isolate the region inside the ring and invert the center disk
+        (x0, y0, x1, y1), keep_mask, invert_mask = self._get_annulus_masks(scale)
+        origin_x, origin_y = self.image_origin if scale == 1 else (0, 0)
+        masked_gray_image = cv2.bitwise_and(gray[y0 - origin_y:y1 - origin_y, x0 - origin_x:x1 - origin_x], keep_mask)
+        cv2.bitwise_xor(masked_gray_image, invert_mask, dst=masked_gray_image)
         if show_control_print: print("cropped outer frame and center disk\n")
         if test_mode: show_preview(masked_gray_image)
         
@@ -276,9 +573,43 @@ class Detector:
         black_white_image = cv2.threshold(masked_gray_image, mask_thresh, 255, cv2.THRESH_BINARY)[1]
         if show_control_print: print("converted to black and white\n")
         if test_mode: show_preview(black_white_image)
+        if scale == 1: self.black_white_image = black_white_image
+        return black_white_image
+
+    def get_black_white_image(self):
+        """
+        @return: black and white version of the whole frame (black outside the roi), reusing the one of the last detection
+        """
+        if self.black_white_image is None:
+            self._create_black_white_image(self._get_gray())
+        x0, y0, x1, y1 = self.get_roi()
+        black_white_frame = np.zeros((self.frame_height, self.frame_width), dtype=np.uint8)
+        black_white_frame[y0:y1, x0:x1] = self.black_white_image
+        return black_white_frame
+
+    def get_dot_image(self):
+        """
+        @return: black frame with a white dot at the center of every detected disk
+        """
+        dotted_image = np.zeros((self.frame_height, self.frame_width), dtype=np.uint8)
+        for x, y in self.circles[0][:, :2]:
+            cv2.circle(dotted_image, (int(x), int(y)), 3, 255, -1)
+        return dotted_image
+
+    def detect_disks(self, test_mode=False, show_control_print=False, print_stat=False):
+        # Load the image
+        image = np.copy(self.get_image())
+        if show_control_print: print(f"\nimage loaded: {self.frame_name}\n")
+
+        # Convert the image to grayscale
+        gray = self._get_gray()
+        if show_control_print: print("converted to grayscale\n")
+        if test_mode: show_preview(gray)
+
+        black_white_image = self._create_black_white_image(gray, test_mode=test_mode, show_control_print=show_control_print)
 
         # Detect the disks using Hough Circle Transform
-        self._detect_circles(black_white_image)
+        self._detect_circles(black_white_image, offset=self.get_roi()[:2])
         if show_control_print: print(f"detected {self.circles.shape[1]} circles\n")
     
         # Draw detected circles
@@ -290,7 +621,97 @@ class Detector:
         if test_mode: show_preview(frame_with_circles)
 
         return frame_with_circles
+
+    def detect_disks_headless(self, with_statistics=False):
+        """
+        Detect the disks without copying, drawing or previewing the frame, for batch jobs.
+
+        Parameters:
+            with_statistics (bool): also calculate the radii statistics of the frame.
+
+        Returns:
+            tuple: centers (N, 2) and radii (N,) as contiguous int32 arrays in pixels,
+            followed by the statistics dict when with_statistics is True.
+        """
+        self._detect_circles(self._create_black_white_image(self._get_gray()), offset=self.get_roi()[:2])
+        return self._get_headless_result(with_statistics)
+
+    def _get_headless_result(self, with_statistics):
+        centers = np.ascontiguousarray(self.circles[0, :, :2])
+        radii = np.ascontiguousarray(self.circles[0, :, 2])
+        if with_statistics:
+            return centers, radii, self.calculate_radii_statistics()
+        return centers, radii
     
+    def detect_disks_incremental(self, prev_circles, with_statistics=False):
+        """
+        Headless detection seeded with the circles of the previous frame.
+        Each previous disk is relocalised inside a small window around its last position, and the detection
+        engine runs only around white regions left uncovered (lost or new disks). If too many disks are lost
+        the frame is detected from scratch.
+
+        Parameters:
+            prev_circles (numpy.ndarray): circles of the previous frame, as returned by get_circles().
+            with_statistics (bool): also calculate the radii statistics of the frame.
+
+        Returns:
+            tuple: same as detect_disks_headless.
+        """
+        black_white_image = self._create_black_white_image(self._get_gray())
+        x0, y0 = self.get_roi()[:2]
+        prior = prev_circles[0].astype(np.int32)
+        prior[:, 0] -= x0
+        prior[:, 1] -= y0
+        circles, tracked = self._relocalise_circles(black_white_image, prior)
+        if len(prior) == 0 or 1 - np.mean(tracked) > MAX_LOST_FRACTION:
+            self._detect_circles(black_white_image, offset=(x0, y0))
+        else:
+            circles = circles[tracked]
+            new_circles = self._detect_uncovered_circles(black_white_image, circles)
+            self._set_circles(np.vstack([circles, new_circles]), offset=(x0, y0))
+        return self._get_headless_result(with_statistics)
+
+    def detect_disks_pyramid(self, scale=2, refine=True, with_statistics=False):
+        """
+        Headless coarse to fine detection. The detection engine runs on the frame decoded at 1/scale resolution
+        (reduced size JPEG decode), then each candidate is refined on the full resolution frame, decoded only then:
+        its center moves to the centroid of the disk's white pixels and its radius is read
+        from the distance transform at that center.
+
+        Parameters:
+            scale (int): resolution reduction of the coarse pass, a key of REDUCED_GRAYSCALE_READ_FLAGS.
+            refine (bool): refine the candidates on the full resolution frame, otherwise only scale them up.
+            with_statistics (bool): also calculate the radii statistics of the frame.
+
+        Returns:
+            tuple: same as detect_disks_headless.
+        """
+        if scale not in REDUCED_GRAYSCALE_READ_FLAGS:
+            raise ValueError(f"Detector.detect_disks_pyramid() scale must be one of {list(REDUCED_GRAYSCALE_READ_FLAGS)}, got {scale}.")
+        reduced_gray = self.frame_source.read(self.frame_name, REDUCED_GRAYSCALE_READ_FLAGS[scale])
+        coarse_x0, coarse_y0 = self._get_annulus_masks(scale)[0][:2]
+        candidates = self._find_circles(self._create_black_white_image(reduced_gray, scale=scale), scale=scale)
+        if candidates is None:
+            raise ValueError(f"Detector.detect_disks_pyramid() No circles were detected in the frame {self.frame_name}.")
+
+        # Back to full resolution pixels of the roi, a reduced pixel covers scale x scale full pixels
+        x0, y0 = self.get_roi()[:2]
+        candidates[:, 0] = (candidates[:, 0] + coarse_x0) * scale + (scale - 1) // 2 - x0
+        candidates[:, 1] = (candidates[:, 1] + coarse_y0) * scale + (scale - 1) // 2 - y0
+        candidates[:, 2] *= scale
+        if refine:
+            black_white_image = self._create_black_white_image(self._get_gray())
+            refined, tracked = self._relocalise_circles(black_white_image, candidates)
+            distances = cv2.distanceTransform(black_white_image, cv2.DIST_L2, 5)
+            roi_height, roi_width = black_white_image.shape
+            xs = np.clip(refined[:, 0], 0, roi_width - 1)
+            ys = np.clip(refined[:, 1], 0, roi_height - 1)
+            radii = np.clip(np.rint(distances[ys, xs]), candidates[:, 2] - scale, candidates[:, 2] + scale)
+            refined[:, 2] = radii
+            candidates[tracked] = refined[tracked]
+        self._set_circles(candidates, offset=(x0, y0))
+        return self._get_headless_result(with_statistics)
+
     def circles_to_bboxes(self):
         """
         Convert circles detected by cv2.HoughCircles to bounding boxes using NumPy.
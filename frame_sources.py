@@ -0,0 +1,613 @@
+from abc import ABC, abstractmethod
+import cv2
+import json
+import numpy as np
+import os
+import re
+import shutil
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tqdm import tqdm
+
+FRAME_NAME_FORMAT = "DSC_{:04d}.jpg" # frame names given to frames of containers, numbered from 1
+FRAME_SUFFIXES = ('.jpg',)
+VIDEO_SUFFIXES = ('.mp4', '.avi', '.mov', '.mkv', '.mjpeg', '.mjpg')
+STACK_SUFFIXES = ('.tif', '.tiff')
+MEMMAP_STACK_FRAMES = "frames.npy" # (frames, height, width) uint8 grayscale crops
+MEMMAP_STACK_INDEX = "index.json" # frame names, crop box and full frame shape of the stack
+FRAME_NUMBER_PATTERN = re.compile(r"(\d+)") # frame number in a frame name, 'DSC_0012.jpg' -> 12
+CACHE_PREFETCH_FRAMES = 8 # frames copied ahead of the frame being read
+CACHE_PREFETCH_WORKERS = 4 # copy threads, copies wait on the mount so a few run at once
+PREFETCH_FRAMES = 4 # decoded frames waiting ahead of the frame being processed, see prefetch_frames
+PREFETCH_WORKERS = 2 # decode threads, cv2 releases the GIL while decoding
+
+# reduced size read flags -> (reduction factor, grayscale)
+REDUCED_READ_FLAGS = {
+    cv2.IMREAD_REDUCED_GRAYSCALE_2: (2, True),
+    cv2.IMREAD_REDUCED_GRAYSCALE_4: (4, True),
+    cv2.IMREAD_REDUCED_GRAYSCALE_8: (8, True),
+    cv2.IMREAD_REDUCED_COLOR_2: (2, False),
+    cv2.IMREAD_REDUCED_COLOR_4: (4, False),
+    cv2.IMREAD_REDUCED_COLOR_8: (8, False),
+}
+
+
+def convert_decoded_frame(frame: np.ndarray, flags: int) -> np.ndarray:
+    """Convert a decoded BGR frame to what cv2.imread would return for the given read flags.
+
+    Args:
+        frame (np.ndarray): BGR frame
+        flags (int): cv2.IMREAD_COLOR, cv2.IMREAD_GRAYSCALE or one of REDUCED_READ_FLAGS
+
+    Returns:
+        np.ndarray: the converted frame
+    """
+    scale, grayscale = REDUCED_READ_FLAGS.get(flags, (1, flags == cv2.IMREAD_GRAYSCALE))
+    if grayscale and len(frame.shape) == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if scale != 1:
+        height, width = frame.shape[:2]
+        frame = cv2.resize(frame, (-(-width // scale), -(-height // scale)), interpolation=cv2.INTER_AREA)
+    return frame
+
+
+class FrameSource(ABC):
+    """Base class of the sources the frames of a measurement are read from.
+    Every source names its frames in format 'DSC_####.jpg', so the rest of the code indexes frames the same way.
+    """
+    concurrent_reads = True # frames can be decoded on several threads at once, see prefetch_frames
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+
+    def get_path(self) -> Path:
+        """Get the path of the source.
+
+        Returns:
+            Path: folder or container file the frames are read from
+        """
+        return self.path
+
+    def get_origin(self) -> tuple:
+        """Get the position of the decoded frames in the full camera frame, for sources that store cropped frames.
+
+        Returns:
+            tuple: (x, y) in pixels of the top left corner of the decoded frames
+        """
+        return 0, 0
+
+    def get_frame_shape(self) -> tuple:
+        """Get the shape of the full camera frame, for sources that store cropped frames.
+
+        Returns:
+            tuple: (height, width) in pixels, or None if it is the shape of the decoded frames
+        """
+        return None
+
+    def refresh(self):
+        """Take the file identities of the frames afresh, in sources that remember them (see FrameManifest).
+        A frame rewritten in place leaves the folder's modification time as it was, so only this notices it.
+        """
+        pass
+
+    @abstractmethod
+    def get_frame_names(self) -> list:
+        """Get the names of the frames in the source.
+
+        Returns:
+            list: sorted list of frame names in format 'DSC_####.jpg'
+        """
+        raise NotImplementedError
+
+    def get_frame_stat(self, frame_name: str) -> tuple:
+        """Get the identity of the file a frame is stored in, to tell when results saved for the frame are stale.
+        The frames of a container share the identity of the container.
+
+        Args:
+            frame_name (str): frame name in format 'DSC_####.jpg'
+
+        Returns:
+            tuple: (size in bytes, modification time in nanoseconds)
+        """
+        stat = self.path.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    @abstractmethod
+    def read(self, frame_name: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        """Decode a frame.
+
+        Args:
+            frame_name (str): frame name in format 'DSC_####.jpg'
+            flags (int, optional): cv2.imread flags. Defaults to cv2.IMREAD_COLOR.
+
+        Raises:
+            FileNotFoundError: If the frame could not be read.
+
+        Returns:
+            np.ndarray: the decoded frame
+        """
+        raise NotImplementedError
+
+    def iter_frames(self, frame_names: list = None, flags: int = cv2.IMREAD_COLOR):
+        """Decode frames one after the other.
+
+        Args:
+            frame_names (list, optional): frame names in format 'DSC_####.jpg'. Defaults to all the frames.
+            flags (int, optional): cv2.imread flags. Defaults to cv2.IMREAD_COLOR.
+
+        Yields:
+            tuple: (frame_name, frame)
+        """
+        for frame_name in (self.get_frame_names() if frame_names is None else frame_names):
+            yield frame_name, self.read(frame_name, flags)
+
+
+class FrameManifest:
+    """Persisted listing of a folder of frames: name, size, modification time and frame number of every frame.
+    The folder is listed again only when its modification time changed (a frame was added, removed or replaced
+    through a rename), and its frames are stat'ed again then (on Windows the listing carries the stats). A frame
+    rewritten in place keeps its listed size and time until refresh(force=True), which Measure.create_artifacts
+    runs before keying the frames. Slow mounts (Google Drive) are listed once instead of on every use,
+    and a manifest of a folder that is not mounted keeps answering from the last listing.
+    """
+    def __init__(self, folder: Path, manifest_path: Path) -> None:
+        self.folder = Path(folder)
+        self.manifest_path = Path(manifest_path)
+        self.folder_mtime_ns = None
+        self.frames = {} # frame name -> [size, mtime_ns, frame number]
+        if self.manifest_path.is_file():
+            with open(self.manifest_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("folder") == str(self.folder):
+                self.folder_mtime_ns, self.frames = manifest["folder_mtime_ns"], manifest["frames"]
+        self.refresh()
+
+    def refresh(self, force: bool = False):
+        """List the folder again if it changed since the last listing.
+
+        Args:
+            force (bool, optional): list the folder and stat every frame again, even if it did not change. Defaults to False.
+        """
+        try:
+            folder_mtime_ns = self.folder.stat().st_mtime_ns
+        except OSError: # not mounted, keep the last listing
+            return
+        if folder_mtime_ns == self.folder_mtime_ns and not force:
+            return
+        frames = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if Path(entry.name).suffix.lower() not in FRAME_SUFFIXES or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                number = FRAME_NUMBER_PATTERN.search(entry.name)
+                frames[entry.name] = [stat.st_size, stat.st_mtime_ns, int(number.group(1)) if number else None]
+        self.folder_mtime_ns, self.frames = folder_mtime_ns, dict(sorted(frames.items()))
+        self._save()
+
+    def _save(self):
+        manifest = {"folder": str(self.folder), "folder_mtime_ns": self.folder_mtime_ns, "frames": self.frames}
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        try:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, "w") as manifest_file:
+                json.dump(manifest, manifest_file)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError: # a read only location only loses the cache
+            pass
+
+    def get_frame_names(self) -> list:
+        """Sorted list of frame names in format 'DSC_####.jpg'"""
+        return list(self.frames)
+
+    def get_frames_num(self) -> int:
+        return len(self.frames)
+
+    def get_frame_stat(self, frame_name: str) -> tuple:
+        """(size in bytes, modification time in nanoseconds) of a frame when it was listed"""
+        size, mtime_ns, _ = self.frames[frame_name]
+        return size, mtime_ns
+
+    def get_frame_number(self, frame_name: str) -> int:
+        """Frame number in the frame name, None if the name has no number"""
+        return self.frames[frame_name][2]
+
+
+class FolderFrameSource(FrameSource):
+    """Folder of 'DSC_####.jpg' image files, one file per frame.
+    With a manifest_path the frames are listed through a FrameManifest instead of listing the folder on every call.
+    """
+    def __init__(self, path: Path, manifest_path: Path = None) -> None:
+        super().__init__(path)
+        self.manifest = FrameManifest(self.path, manifest_path) if manifest_path is not None else None
+
+    def get_frame_names(self) -> list:
+        if self.manifest is not None:
+            self.manifest.refresh()
+            return self.manifest.get_frame_names()
+        return sorted(file.name for file in self.path.iterdir() if file.is_file() and file.suffix.lower() in FRAME_SUFFIXES)
+
+    def get_frame_path(self, frame_name: str) -> Path:
+        return (self.path / frame_name).resolve()
+
+    def refresh(self):
+        if self.manifest is not None:
+            self.manifest.refresh(force=True)
+
+    def get_frame_stat(self, frame_name: str) -> tuple:
+        # a listed frame answers from the manifest (see refresh), without a stat per frame
+        if self.manifest is not None:
+            try:
+                return self.manifest.get_frame_stat(frame_name)
+            except KeyError: # not listed yet
+                pass
+        stat = self.get_frame_path(frame_name).stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def read(self, frame_name: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        frame_path = self.get_frame_path(frame_name)
+        frame = cv2.imread(str(frame_path), flags)
+        if frame is None:
+            raise FileNotFoundError(f"FolderFrameSource.read() Could not read the image at {frame_path}.")
+        return frame
+
+
+class CachedFrameSource(FrameSource):
+    """Read-through local cache of a folder of frames on a slow mount (the Google Drive folder of a measurement).
+    A read copies the frame file to the cache folder once, and the next frames in order are copied ahead on
+    background threads while the current frame is processed. Cached files keep the size and modification time
+    of their source, so a cached file that no longer matches the source is copied again. The cache folder is
+    capped at size_limit bytes, evicting the least recently read frames.
+    """
+    def __init__(self, source: FolderFrameSource, cache_path: Path, size_limit: int, prefetch_frames: int = CACHE_PREFETCH_FRAMES) -> None:
+        if not isinstance(source, FolderFrameSource):
+            raise ValueError(f"CachedFrameSource() only folders of frames can be cached, got {type(source).__name__}")
+        super().__init__(source.get_path())
+        self.source = source
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.size_limit = size_limit
+        self.prefetch_frames = prefetch_frames
+        self.frame_order = None # frame names in order, listed on the first read
+        self.frame_indices = None # frame name -> position in frame_order
+        self.entries = OrderedDict() # cached frame name -> size, least recently read first
+        cached = sorted((entry.stat().st_atime_ns, entry.name, entry.stat().st_size) for entry in os.scandir(self.cache_path)
+                        if entry.is_file() and Path(entry.name).suffix.lower() in FRAME_SUFFIXES)
+        for _, frame_name, size in cached:
+            self.entries[frame_name] = size
+        self.cache_bytes = sum(self.entries.values())
+        self._start()
+
+    def _start(self):
+        self.lock = threading.Lock()
+        self.fetches = {} # frame name -> future of a copy in flight
+        self.executor = ThreadPoolExecutor(max_workers=CACHE_PREFETCH_WORKERS)
+
+    def __getstate__(self):
+        # process pool workers get their own copy threads
+        state = self.__dict__.copy()
+        for name in ("lock", "fetches", "executor"):
+            state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._start()
+
+    def get_source(self) -> FolderFrameSource:
+        return self.source
+
+    def refresh(self):
+        self.source.refresh()
+
+    def get_frame_names(self) -> list:
+        return self.source.get_frame_names()
+
+    def get_frame_stat(self, frame_name: str) -> tuple:
+        return self.source.get_frame_stat(frame_name)
+
+    def get_frame_path(self, frame_name: str) -> Path:
+        """Get the path of the cached copy of a frame, copying it first if it is not cached."""
+        with self.lock:
+            future = self.fetches.get(frame_name)
+        return future.result() if future is not None else self._fetch(frame_name)
+
+    def read(self, frame_name: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        self._prefetch_after(frame_name)
+        try:
+            frame = cv2.imread(str(self.get_frame_path(frame_name)), flags)
+        except OSError: # the copy failed, read the source directly
+            frame = None
+        return frame if frame is not None else self.source.read(frame_name, flags)
+
+    def _prefetch_after(self, frame_name: str):
+        if self.frame_order is None:
+            self.frame_order = self.get_frame_names()
+            self.frame_indices = {name: i for i, name in enumerate(self.frame_order)}
+        if frame_name not in self.frame_indices:
+            return
+        i = self.frame_indices[frame_name]
+        with self.lock:
+            for next_name in self.frame_order[i + 1:i + 1 + self.prefetch_frames]:
+                if next_name not in self.fetches:
+                    self.fetches[next_name] = self.executor.submit(self._prefetch, next_name)
+
+    def _prefetch(self, frame_name: str) -> Path:
+        try:
+            return self._fetch(frame_name)
+        finally:
+            with self.lock:
+                self.fetches.pop(frame_name, None)
+
+    def _fetch(self, frame_name: str) -> Path:
+        """Copy a frame to the cache unless its cached copy matches the source (size and modification time)."""
+        cache_path = self.cache_path / frame_name
+        size, mtime_ns = self.source.get_frame_stat(frame_name)
+        try:
+            stat = cache_path.stat()
+            if (stat.st_size, stat.st_mtime_ns) == (size, mtime_ns):
+                self._touch(frame_name, size)
+                return cache_path
+        except FileNotFoundError:
+            pass
+        tmp_path = self.cache_path / f".{frame_name}.{threading.get_ident()}.tmp"
+        shutil.copy2(self.source.get_frame_path(frame_name), tmp_path) # keeps the modification time of the source
+        os.replace(tmp_path, cache_path)
+        self._touch(frame_name, size)
+        return cache_path
+
+    def _touch(self, frame_name: str, size: int):
+        """Mark a frame as the most recently read, and evict the least recently read frames above the size limit."""
+        with self.lock:
+            self.cache_bytes += size - self.entries.get(frame_name, 0)
+            self.entries[frame_name] = size
+            self.entries.move_to_end(frame_name)
+            while self.cache_bytes > self.size_limit and len(self.entries) > 1:
+                evicted_name, evicted_size = self.entries.popitem(last=False)
+                self.cache_bytes -= evicted_size
+                try:
+                    (self.cache_path / evicted_name).unlink()
+                except OSError: # already gone, or open in another process
+                    pass
+
+    def release(self):
+        """Stop the copy threads, waiting for the copies in flight."""
+        self.executor.shutdown(wait=True)
+
+
+class VideoFrameSource(FrameSource):
+    """Video container (MP4, MJPEG, ...) read sequentially, the i-th frame is named 'DSC_{i:04d}.jpg'.
+    Reading frames in order never seeks, a read out of order seeks the container once.
+    """
+    concurrent_reads = False # one capture, read in order
+
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        self.capture = None
+        self.next_index = 0
+        self.lock = threading.Lock()
+        capture = cv2.VideoCapture(str(self.path))
+        if not capture.isOpened():
+            raise FileNotFoundError(f"VideoFrameSource() Could not open the video at {self.path}.")
+        self.frames_num = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+
+    def __getstate__(self):
+        # an open capture can not be pickled, each process pool worker opens its own
+        state = self.__dict__.copy()
+        state["capture"] = None
+        state["next_index"] = 0
+        state["lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def get_frame_names(self) -> list:
+        return [FRAME_NAME_FORMAT.format(i + 1) for i in range(self.frames_num)]
+
+    def read(self, frame_name: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        with self.lock: # a prefetch thread and the detector may read at once
+            return self._read(frame_name, flags)
+
+    def _read(self, frame_name: str, flags: int) -> np.ndarray:
+        index = int(Path(frame_name).stem[4:]) - 1
+        if self.capture is None:
+            self.capture = cv2.VideoCapture(str(self.path))
+            self.next_index = 0
+        if index != self.next_index:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+        success, frame = self.capture.read()
+        if not success:
+            self.next_index = -1 # unknown position, seek on the next read
+            raise FileNotFoundError(f"VideoFrameSource.read() Could not read frame {frame_name} of the video at {self.path}.")
+        self.next_index = index + 1
+        return convert_decoded_frame(frame, flags)
+
+    def release(self) -> None:
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class ImageStackFrameSource(FrameSource):
+    """Multi page image file (TIFF stack), the i-th page is named 'DSC_{i:04d}.jpg'."""
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        self.frames_num = cv2.imcount(str(self.path))
+        if self.frames_num <= 0:
+            raise FileNotFoundError(f"ImageStackFrameSource() Could not open the image stack at {self.path}.")
+
+    def get_frame_names(self) -> list:
+        return [FRAME_NAME_FORMAT.format(i + 1) for i in range(self.frames_num)]
+
+    def read(self, frame_name: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        index = int(Path(frame_name).stem[4:]) - 1
+        success, pages = cv2.imreadmulti(str(self.path), start=index, count=1, flags=cv2.IMREAD_UNCHANGED)
+        if not success or len(pages) == 0:
+            raise FileNotFoundError(f"ImageStackFrameSource.read() Could not read frame {frame_name} of the image stack at {self.path}.")
+        frame = pages[0]
+        if len(frame.shape) == 2:
+            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        return convert_decoded_frame(frame, flags)
+
+
+class MemmapFrameSource(FrameSource):
+    """Folder with a single memory mapped stack of cropped grayscale uint8 frames (see write_memmap_stack).
+    Grayscale reads return views into the page cache, with no decode and no copy.
+    """
+    def __init__(self, path: Path) -> None:
+        super().__init__(path)
+        with open(self.path / MEMMAP_STACK_INDEX, "r") as index_file:
+            index = json.load(index_file)
+        self.frame_names = index["frame_names"]
+        self.frame_indices = {frame_name: i for i, frame_name in enumerate(self.frame_names)}
+        self.roi = tuple(index["roi"])
+        self.frame_shape = tuple(index["frame_shape"])
+        self.frames = np.load(self.path / MEMMAP_STACK_FRAMES, mmap_mode='r')
+
+    def __getstate__(self):
+        # pickling a memmap copies its data, process pool workers map the stack file again instead
+        state = self.__dict__.copy()
+        state["frames"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.frames = np.load(self.path / MEMMAP_STACK_FRAMES, mmap_mode='r')
+
+    def get_origin(self) -> tuple:
+        return self.roi[:2]
+
+    def get_frame_shape(self) -> tuple:
+        return self.frame_shape
+
+    def get_roi(self) -> tuple:
+        """Get the crop box of the stored frames.
+
+        Returns:
+            tuple: (x0, y0, x1, y1) in pixels of the full frame, x1 and y1 exclusive
+        """
+        return self.roi
+
+    def get_frame_names(self) -> list:
+        return list(self.frame_names)
+
+    def get_frame_stat(self, frame_name: str) -> tuple:
+        stat = (self.path / MEMMAP_STACK_FRAMES).stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def read(self, frame_name: str, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        """Read a stored frame, see FrameSource.read.
+        Grayscale reads are read only views of the stack, other flags return converted copies of the crop.
+        Reduced reads are returned as whole reduced frames (black outside the crop), like a reduced decode of the file.
+        """
+        if frame_name not in self.frame_indices:
+            raise FileNotFoundError(f"MemmapFrameSource.read() frame {frame_name} is not in the stack at {self.path}.")
+        frame = self.frames[self.frame_indices[frame_name]]
+        if flags in (cv2.IMREAD_GRAYSCALE, cv2.IMREAD_UNCHANGED):
+            return frame
+        scale, grayscale = REDUCED_READ_FLAGS.get(flags, (1, False))
+        if scale == 1:
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+        frame_height, frame_width = self.frame_shape
+        x0, y0, x1, y1 = self.roi
+        reduced = np.zeros((-(-frame_height // scale), -(-frame_width // scale)), dtype=np.uint8)
+        reduced_x0, reduced_y0 = x0 // scale, y0 // scale
+        crop = cv2.resize(np.asarray(frame), (-(-x1 // scale) - reduced_x0, -(-y1 // scale) - reduced_y0), interpolation=cv2.INTER_AREA)
+        reduced[reduced_y0:reduced_y0 + crop.shape[0], reduced_x0:reduced_x0 + crop.shape[1]] = crop
+        return reduced if grayscale else cv2.cvtColor(reduced, cv2.COLOR_GRAY2BGR)
+
+
+def prefetch_frames(frame_source: FrameSource, frame_names: list, flags: int = cv2.IMREAD_COLOR, ahead: int = PREFETCH_FRAMES,
+                    workers: int = PREFETCH_WORKERS):
+    """Decode frames ahead on a thread pool while the caller processes the current frame, so decoding (and the
+    file reads under it) overlaps the caller's compute. At most `ahead` decoded frames wait in memory.
+    Sources without concurrent reads are decoded on a single thread, in order.
+
+    Args:
+        frame_source (FrameSource): source of the frames
+        frame_names (list): frame names in format 'DSC_####.jpg', in the order to yield them
+        flags (int, optional): cv2.imread flags. Defaults to cv2.IMREAD_COLOR.
+        ahead (int, optional): frames decoded ahead. Defaults to PREFETCH_FRAMES.
+        workers (int, optional): decode threads. Defaults to PREFETCH_WORKERS.
+
+    Yields:
+        tuple: (frame_name, frame)
+    """
+    names = iter(frame_names)
+    executor = ThreadPoolExecutor(max_workers=workers if frame_source.concurrent_reads else 1)
+    pending = deque()
+    try:
+        for frame_name in names:
+            pending.append((frame_name, executor.submit(frame_source.read, frame_name, flags)))
+            if len(pending) > ahead:
+                frame_name, future = pending.popleft()
+                yield frame_name, future.result()
+        while pending:
+            frame_name, future = pending.popleft()
+            yield frame_name, future.result()
+    finally: # also when the caller stops early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def write_memmap_stack(frame_source: FrameSource, stack_path: Path, roi: tuple, frame_shape: tuple, frame_names: list = None) -> MemmapFrameSource:
+    """Convert frames to a single memory mapped stack of cropped grayscale uint8 frames, decoding each frame once.
+
+    Args:
+        frame_source (FrameSource): source of the full frames
+        stack_path (Path): folder to write the stack and its index to
+        roi (tuple): (x0, y0, x1, y1) crop box in pixels of the full frame, x1 and y1 exclusive
+        frame_shape (tuple): (height, width) of the full frame
+        frame_names (list, optional): frame names in format 'DSC_####.jpg'. Defaults to all the frames of the source.
+
+    Returns:
+        MemmapFrameSource: the written stack
+    """
+    stack_path = Path(stack_path)
+    stack_path.mkdir(parents=True, exist_ok=True)
+    # the index is removed first and written last, so a stack without an index is an unfinished conversion
+    (stack_path / MEMMAP_STACK_INDEX).unlink(missing_ok=True)
+    frame_names = frame_source.get_frame_names() if frame_names is None else list(frame_names)
+    x0, y0, x1, y1 = roi
+    frames = np.lib.format.open_memmap(stack_path / MEMMAP_STACK_FRAMES, mode='w+', dtype=np.uint8, shape=(len(frame_names), y1 - y0, x1 - x0))
+    for i, (frame_name, frame) in enumerate(tqdm(frame_source.iter_frames(frame_names, cv2.IMREAD_GRAYSCALE), total=len(frame_names))):
+        frames[i] = frame[y0:y1, x0:x1]
+    frames.flush()
+    del frames
+    index_tmp_path = stack_path / (MEMMAP_STACK_INDEX + ".tmp")
+    with open(index_tmp_path, "w") as index_file:
+        json.dump({"frame_names": frame_names, "roi": [int(v) for v in roi], "frame_shape": [int(v) for v in frame_shape]}, index_file)
+    os.replace(index_tmp_path, stack_path / MEMMAP_STACK_INDEX)
+    return MemmapFrameSource(stack_path)
+
+
+def open_frame_source(path, manifest_path: Path = None) -> FrameSource:
+    """Open the frame source matching the path.
+
+    Args:
+        path (Path or FrameSource): folder of frames, memory mapped stack folder, video container or image stack file.
+            A FrameSource is returned as is.
+        manifest_path (Path, optional): where to persist the listing of a folder of frames, see FrameManifest. Defaults to None.
+
+    Raises:
+        ValueError: If the path is neither a folder nor a supported container file.
+
+    Returns:
+        FrameSource: the source of the frames
+    """
+    if isinstance(path, FrameSource):
+        return path
+    path = Path(path)
+    if path.is_dir() and (path / MEMMAP_STACK_INDEX).is_file():
+        return MemmapFrameSource(path)
+    if path.is_dir():
+        return FolderFrameSource(path, manifest_path)
+    if path.suffix.lower() in VIDEO_SUFFIXES:
+        return VideoFrameSource(path)
+    if path.suffix.lower() in STACK_SUFFIXES:
+        return ImageStackFrameSource(path)
+    raise ValueError(f"open_frame_source() {path} is neither a folder of frames nor one of {VIDEO_SUFFIXES + STACK_SUFFIXES}")
@@ -18,7 +18,7 @@ class ParticleTracker(BaseAnalysisWindow):
         super().__init__(measure, source, scripter=ParticleTrackerScripter)
         self.setWindowTitle("Particle Tracker")
         self.measure = measure
-        self.measure_data = self.measure.load_measure_data(source='drive')
+        self.measure_data = self.measure.get_measure_data(source='drive')
         self.kdt = Kdt(measure)
         self.plotter = Plotter(measure, source)
         self.calculator = Calculator(measure)
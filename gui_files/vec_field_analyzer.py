@@ -10,6 +10,7 @@ from PySide6.QtWidgets import (
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 
 from measurements_detectors import Measure
+from kdt_method import Kdt
 from visualization import Plotter
 from calculator import Calculator
 
@@ -30,7 +31,8 @@ class VectorFieldAnalyzer(BaseAnalysisWindow):
         self.setWindowTitle("Vector Field Analyzer (PySide6)")
         self.plotter = Plotter(measure, source)
         self.calculator = Calculator(measure)
-        self.measure_stat = self.measure.load_measure_data(source='drive')["statistic"]
+        self.measure_store = self.measure.get_measure_store(source='drive')
+        self.kdt = None # for Kdt vector fields that were not saved, built on first use
         self.vector_field = {}
         self.add_rings = True
         self.init_ui()
@@ -168,6 +170,12 @@ class VectorFieldAnalyzer(BaseAnalysisWindow):
         try:
             return self.plotter.load_vector_field(first_frame_name, second_frame_name)
         except FileNotFoundError:
+            if self.source == Kdt.__name__: # derive the field from the particle trajectories instead
+                if self.kdt is None: self.kdt = Kdt(self.measure)
+                try:
+                    return self.kdt.get_vector_field(first_frame_name, second_frame_name)
+                except KeyError: # a frame the measure store skipped (see Measure.save_measure_data frame_step)
+                    pass
             print(f"==== check existance of {first_frame_name}_{second_frame_name} in vector_field folder of measure: {self.measure.get_name()} ====")
 
     def calculate_displacement_stats(self, x: np.array, y: np.array, u, v) -> tuple:
@@ -189,6 +197,8 @@ class VectorFieldAnalyzer(BaseAnalysisWindow):
         frame1 = f"DSC_{frame1_val:04d}.jpg"
         frame2 = f"DSC_{frame2_val:04d}.jpg"
         vector_field = self.load_vector_field_data(frame1, frame2)
+        if vector_field is None: # nothing to draw for these frames
+            return ax_vf, ax_av, figure, colorbar
         x, y, u, v = vector_field['x'], vector_field['y'], vector_field['u'], vector_field['v']
         radii, dr, rad_disp, tan_disp = self.calculate_displacement_stats(x, y, u, v)
         
@@ -206,7 +216,7 @@ class VectorFieldAnalyzer(BaseAnalysisWindow):
             colorbar = None
         
         # Plot the updated data
-        ax_av = self.plotter.plot_displacement_by_rings(ax_av, self.measure_stat, frame1, frame2, radii, rad_disp, tan_disp)
+        ax_av = self.plotter.plot_displacement_by_rings(ax_av, self.measure_store, frame1, frame2, radii, rad_disp, tan_disp)
         ax_vf, colorbar = self.plotter.plot_vector_field(ax_vf, x, y, u, v, frame1, frame2, add_rings=self.add_rings, radii=radii, dr=dr)
         return ax_vf, ax_av, figure, colorbar
     
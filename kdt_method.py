@@ -1,21 +1,289 @@
 from measurements_detectors import Measure
+from measure_store import MeasureStore
 from detection_lib import SMALL_DISK_RADIUS, PIXEL_TO_MM_RATIO
 import numpy as np
-from scipy.spatial import KDTree
-from project_tools import create_product_name
-import pandas as pd
+from scipy.spatial import KDTree, cKDTree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.optimize import linear_sum_assignment
+from project_tools import create_product_name, select_frame_pairs
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 from tqdm import tqdm
 
 MAX_SINGLE_DISPLACEMENT = 2 * SMALL_DISK_RADIUS * PIXEL_TO_MM_RATIO # pixels
+TREES_CACHE_SIZE = 64 # frames whose KDTree is kept for repeated pair queries
+PAIRS_CHUNKS_PER_WORKER = 4 # more chunks than workers keeps the pool busy to the end
+KDTREE_LEAFSIZE = 10 # leaf size of scipy's KDTree, the trees are built with it so nearest neighbour ties break the same way
+PREDICTION_GATE = SMALL_DISK_RADIUS * PIXEL_TO_MM_RATIO / 2 # pixels, search radius around a predicted position
+VELOCITY_SMOOTHING = 0.5 # weight of the last displacement in a particle's velocity, the rest is its earlier velocity
+PREDICTION_NEIGHBOURS = 4 # tracked neighbours whose velocities predict a particle with no history of its own
+BOOTSTRAP_ITERATIONS = 5 # affine motion refits that predict the first link, when no particle has a history yet
+
+def _filter_matches(frame1_centers, frame2_centers, distances, indices):
+    """Keep the nearest neighbour matches of frame1 in frame2 closer than MAX_SINGLE_DISPLACEMENT.
+    Returns the matched frame1 and frame2 centers, their distances, the frame2 indices and the displacements"""
+    # Filter out bad matches
+    valid = distances < MAX_SINGLE_DISPLACEMENT
+    valid_indices = indices[valid]
+    matched_frame1 = frame1_centers[valid]
+    matched_frame2 = frame2_centers[valid_indices]
+    valid_distances = distances[valid]
+    
+    # Create displacement vectors
+    displacements = matched_frame2 - matched_frame1
+
+    return matched_frame1, matched_frame2, valid_distances, valid_indices, displacements
+
+
+def _format_vector_field(matched_frame1, displacements):
+    """Text of a vector field file, tab separated x, y, u, v columns with a header
+    (what pd.DataFrame.to_csv(sep='\t', index=False) writes for float64 columns, without building a DataFrame)"""
+    rows = np.hstack([matched_frame1, displacements]).tolist()
+    return "x\ty\tu\tv\n" + "".join("\t".join(map(repr, row)) + "\n" for row in rows)
+
+
+def _group_pairs(pairs):
+    """Group (i, j) frame pairs sorted by j (see select_frame_pairs) to (j, [i, ...]) destinations"""
+    destinations = []
+    for i, j in pairs:
+        if not destinations or destinations[-1][0] != j: destinations.append((j, []))
+        destinations[-1][1].append(i)
+    return destinations
+
+
+def _save_vector_fields(measure_store: MeasureStore, frame_names, destinations, vector_field_path, measure_name, source_name,
+                        query_workers=1, progress=None):
+    """Save the vector fields of the pairs (i, j) for every destination frame j and its earlier frames i in destinations.
+    The tree of each destination frame is built once and all its earlier frames are matched against it in one query.
+    Also the process pool worker of Kdt.run_all_vector_fields, the store is memory mapped again in the worker.
+
+    Args:
+        measure_store (MeasureStore): centers of the frames
+        frame_names (list): frame names in format 'DSC_####.jpg', in frame order, at least up to the last destination
+        destinations (list): (j, [i, ...]) indices in frame_names of the destination frames and of their earlier frames
+        vector_field_path (Path): folder to save the vector fields to
+        measure_name (str): name of the measure, see create_product_name
+        source_name (str): name of the method, see create_product_name
+        query_workers (int, optional): threads of every tree query, -1 for all the cores. Defaults to 1.
+        progress (tqdm, optional): progress bar to update per saved pair. Defaults to None.
+
+    Returns:
+        int: number of saved pairs
+    """
+    centers_arrays = {} # frame index -> float64 centers, read from the store once
+    def get_centers(frame):
+        if frame not in centers_arrays:
+            centers_arrays[frame] = np.asarray(measure_store.get_centers(frame_names[frame]), dtype=np.float64)
+        return centers_arrays[frame]
+
+    for j, sources in destinations:
+        frame2_centers = get_centers(j)
+        sources_centers = [get_centers(i) for i in sources]
+        bounds = np.cumsum([0] + [len(centers) for centers in sources_centers])
+        distances, indices = cKDTree(frame2_centers, leafsize=KDTREE_LEAFSIZE).query(np.concatenate(sources_centers), workers=query_workers)
+        texts = [] # the files of a destination frame are written together, after its matching
+        for k, i in enumerate(sources):
+            frame_slice = slice(bounds[k], bounds[k + 1])
+            matched_frame1, _, _, _, displacements = _filter_matches(sources_centers[k], frame2_centers, distances[frame_slice], indices[frame_slice])
+            product_name = create_product_name(measure_name, frame_names[i], frame_names[j], source_name)
+            texts.append((f"{vector_field_path}/{product_name}.txt", _format_vector_field(matched_frame1, displacements)))
+        for path, text in texts:
+            with open(path, "w") as vector_field_file:
+                vector_field_file.write(text)
+        if progress is not None: progress.update(len(sources))
+        # the banded modes only look back a few frames, keep the centers of the frames still ahead of us
+        for frame in [frame for frame in centers_arrays if frame < sources[0]]: del centers_arrays[frame]
+    return sum(len(sources) for j, sources in destinations)
+
+
+def _mutual_nearest_matches(prev_centers, curr_centers, gate=MAX_SINGLE_DISPLACEMENT):
+    """Match particles of consecutive frames that are each other's nearest neighbour, closer than gate.
+    Returns the indices of the matched particles in prev_centers and in curr_centers"""
+    if len(prev_centers) == 0 or len(curr_centers) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    # a mutual match is closer than the gate both ways, so the queries can stop there
+    # (particles with no neighbour that close get an infinite distance), and only the previous particles that are
+    # the nearest of some current particle are queried back, not every particle carried from earlier frames
+    dist_backward, idx_backward = cKDTree(prev_centers, leafsize=KDTREE_LEAFSIZE).query(curr_centers, distance_upper_bound=gate, workers=-1)
+    candidates = np.unique(idx_backward[dist_backward < gate])
+    dist_forward, idx_forward = cKDTree(curr_centers, leafsize=KDTREE_LEAFSIZE).query(prev_centers[candidates], distance_upper_bound=gate, workers=-1)
+    valid = dist_forward < gate
+    mutual = np.zeros(len(candidates), dtype=bool)
+    mutual[valid] = idx_backward[idx_forward[valid]] == candidates[valid]
+    return candidates[mutual], idx_forward[mutual]
+
+
+def _assignment_matches(prev_centers, curr_centers, gate=MAX_SINGLE_DISPLACEMENT):
+    """Match particles of consecutive frames one to one, among the candidate pairs closer than gate.
+    Unlike nearest neighbours, two previous particles never take the same current particle: the candidate pairs are
+    assigned with the least total displacement, where leaving a particle unmatched costs the gate.
+    The candidate pairs split to connected components, which are small next to the frame: a component with a single
+    candidate pair is linked directly, and every other component is solved on its own as a small dense assignment.
+    Returns the indices of the matched particles in prev_centers and in curr_centers"""
+    if len(prev_centers) == 0 or len(curr_centers) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    candidates = cKDTree(prev_centers).sparse_distance_matrix(cKDTree(curr_centers), gate, output_type='ndarray')
+    candidates = candidates[candidates['v'] < gate]
+    prev_idx, curr_idx, distances = candidates['i'].astype(np.int64), candidates['j'].astype(np.int64), candidates['v']
+    # previous particles are the nodes 0..n-1 and current particles the nodes n.., a candidate pair is an edge
+    prev_num, curr_num = len(prev_centers), len(curr_centers)
+    graph = coo_matrix((np.ones(len(prev_idx)), (prev_idx, prev_num + curr_idx)), shape=(prev_num + curr_num,) * 2)
+    _, labels = connected_components(graph, directed=False)
+    pair_labels = labels[prev_idx]
+    lone = np.bincount(pair_labels, minlength=len(labels))[pair_labels] == 1
+    prev_matched, curr_matched = [prev_idx[lone]], [curr_idx[lone]]
+    rest = np.flatnonzero(~lone)
+    rest = rest[np.argsort(pair_labels[rest], kind='stable')]
+    for component in np.split(rest, np.flatnonzero(np.diff(pair_labels[rest])) + 1):
+        if len(component) == 0: continue
+        prev_matched_component, curr_matched_component = _assign_pairs(prev_idx[component], curr_idx[component], distances[component], gate)
+        prev_matched.append(prev_matched_component)
+        curr_matched.append(curr_matched_component)
+    prev_matched, curr_matched = np.concatenate(prev_matched), np.concatenate(curr_matched)
+    order = np.argsort(prev_matched)
+    return prev_matched[order], curr_matched[order]
+
+
+def _assign_pairs(prev_idx, curr_idx, distances, gate):
+    """One to one assignment of the candidate pairs (prev_idx[k], curr_idx[k]) at distances[k] of one connected component,
+    with the least total distance plus the gate for every particle left unmatched. Returns the assigned previous and current indices"""
+    rows, prev_local = np.unique(prev_idx, return_inverse=True)
+    cols, curr_local = np.unique(curr_idx, return_inverse=True)
+    # Linking a candidate pair saves the gate of both its particles, so a pair costs its distance minus twice the gate
+    # (always negative, a candidate is closer than the gate), and a cell that is no candidate costs 0, the same as
+    # leaving both particles unmatched. The dense rectangular assignment then assigns the smaller side in full,
+    # and the cells that are no candidates are dropped from it.
+    costs = np.zeros((len(rows), len(cols)))
+    costs[prev_local, curr_local] = distances - 2 * gate
+    assigned_rows, assigned_cols = linear_sum_assignment(costs)
+    linked = costs[assigned_rows, assigned_cols] < 0
+    return rows[assigned_rows[linked]], cols[assigned_cols[linked]]
+
+
+LINKERS = {"mutual": _mutual_nearest_matches, "assignment": _assignment_matches} # how consecutive frames are matched, see Kdt
+
+
+def _bootstrap_velocities(prev_centers, curr_centers, match_fn):
+    """Displacements of the particles of two frames under their overall affine motion (such as an inflation),
+    for the first link of particles with no history. The motion is fitted to the matches within PREDICTION_GATE of
+    the prediction, which are reliable (such as the slow particles near the center of an inflation), and the frames
+    are matched again around the fitted motion, so the matches it covers grow every iteration."""
+    homogeneous = np.column_stack([prev_centers, np.ones(len(prev_centers))])
+    predicted = prev_centers
+    for _ in range(BOOTSTRAP_ITERATIONS):
+        prev_matched, curr_matched = match_fn(predicted, curr_centers, gate=PREDICTION_GATE)
+        if len(prev_matched) < 3: # the frames moved more than the small gate, fit to the full gate matches
+            prev_matched, curr_matched = match_fn(predicted, curr_centers)
+        if len(prev_matched) < 3: break # too few matches to fit a motion to
+        motion, *_ = np.linalg.lstsq(homogeneous[prev_matched], curr_centers[curr_matched], rcond=None)
+        predicted = homogeneous @ motion
+    return predicted - prev_centers
+
+
+def _predicted_matches(prev_centers, curr_centers, prev_velocities, match_fn):
+    """Match the particles of consecutive frames around their positions predicted by their velocities.
+    A particle with no velocity yet (NaN) takes the mean velocity of its nearest tracked neighbours, or the overall
+    motion of the frames when no particle is tracked yet (see _bootstrap_velocities).
+    Particles are first searched within PREDICTION_GATE of their predicted positions, and the particles left are searched
+    within MAX_SINGLE_DISPLACEMENT of them.
+    Returns the indices of the matched particles in prev_centers and in curr_centers"""
+    if len(prev_centers) == 0 or len(curr_centers) == 0:
+        return match_fn(prev_centers, curr_centers)
+    tracked = ~np.isnan(prev_velocities[:, 0])
+    velocities = prev_velocities.copy()
+    if not tracked.any():
+        velocities = _bootstrap_velocities(prev_centers, curr_centers, match_fn)
+    elif not tracked.all():
+        neighbours_num = min(PREDICTION_NEIGHBOURS, np.count_nonzero(tracked))
+        _, neighbours = cKDTree(prev_centers[tracked]).query(prev_centers[~tracked], k=neighbours_num, workers=-1)
+        velocities[~tracked] = prev_velocities[tracked][np.reshape(neighbours, (-1, neighbours_num))].mean(axis=1)
+    predicted = prev_centers + velocities
+    prev_matched, curr_matched = match_fn(predicted, curr_centers, gate=PREDICTION_GATE)
+    # a second chance with the full gate, for particles that moved against their prediction
+    prev_left = np.setdiff1d(np.arange(len(prev_centers)), prev_matched)
+    curr_left = np.setdiff1d(np.arange(len(curr_centers)), curr_matched)
+    prev_matched_left, curr_matched_left = match_fn(predicted[prev_left], curr_centers[curr_left])
+    return np.concatenate([prev_matched, prev_left[prev_matched_left]]), np.concatenate([curr_matched, curr_left[curr_matched_left]])
+
+
+def _link_frames(centers_arrays, match_fn, predict=False):
+    """Link the particles of consecutive frames into particle identities, matching every frame once to the frame before it.
+    A particle that is not matched ends its identity, and an unmatched particle of the next frame starts a new one.
+
+    Args:
+        centers_arrays (list): (n, 2) centers of every frame, in frame order
+        match_fn (callable): match_fn(prev_centers, curr_centers, gate) -> matched indices in prev_centers and in curr_centers
+        predict (bool, optional): search every particle around its position predicted by its recent displacements
+            with a small gate (see _predicted_matches), so frames far apart, such as every 5th frame of a slow
+            inflation, can be linked. The velocities are per frame of centers_arrays, which should be evenly spaced.
+            Defaults to False.
+
+    Returns:
+        np.ndarray: (frames, particles) int64, the index of every particle identity in each frame's centers, -1 where it is not detected
+    """
+    frames_ids = []
+    particles_num = 0
+    velocities = np.full((0, 2), np.nan) # per identity, displacement per frame smoothed over its history, NaN until linked
+    for f, centers in enumerate(centers_arrays):
+        ids = np.full(len(centers), -1, dtype=np.int64)
+        if f > 0:
+            prev_centers, prev_ids = centers_arrays[f - 1], frames_ids[-1]
+            if predict:
+                prev_matched, curr_matched = _predicted_matches(prev_centers, centers, velocities[prev_ids], match_fn)
+            else:
+                prev_matched, curr_matched = match_fn(prev_centers, centers)
+            ids[curr_matched] = prev_ids[prev_matched]
+            if predict and len(curr_matched):
+                displacements = centers[curr_matched] - prev_centers[prev_matched]
+                matched_velocities = velocities[ids[curr_matched]]
+                velocities[ids[curr_matched]] = np.where(np.isnan(matched_velocities), displacements,
+                                                         VELOCITY_SMOOTHING * displacements + (1 - VELOCITY_SMOOTHING) * matched_velocities)
+        new = np.flatnonzero(ids < 0)
+        ids[new] = np.arange(particles_num, particles_num + len(new))
+        particles_num += len(new)
+        if predict and particles_num > len(velocities): # grown geometrically, not copied every frame
+            velocities = np.concatenate([velocities, np.full((max(particles_num, 2 * len(velocities)) - len(velocities), 2), np.nan)])
+        frames_ids.append(ids)
+    indices = np.full((len(centers_arrays), particles_num), -1, dtype=np.int64)
+    for f, ids in enumerate(frames_ids):
+        indices[f, ids] = np.arange(len(ids))
+    return indices
+
+
+def _split_pairs(destinations, chunks_num):
+    """Split (j, [i, ...]) destinations (see _group_pairs) to contiguous chunks with balanced numbers of pairs."""
+    pairs_per_chunk = sum(len(sources) for j, sources in destinations) / max(1, chunks_num)
+    chunks, start, pairs = [], 0, 0
+    for k, (j, sources) in enumerate(destinations):
+        pairs += len(sources)
+        if pairs >= (len(chunks) + 1) * pairs_per_chunk or k == len(destinations) - 1:
+            chunks.append(destinations[start:k + 1])
+            start = k + 1
+    return chunks
+
 
 class Kdt:
-    def __init__(self, measure: Measure):
+    def __init__(self, measure: Measure, linker='mutual', predict=False):
+        """
+        @param measure: the measure to match the particles of
+        @param linker: how consecutive frames are linked into trajectories, 'mutual' (nearest neighbours) or
+            'assignment' (one to one, for dense frames), see LINKERS
+        @param predict: link around the positions predicted by the particles' velocities, for measure data
+            detected every few frames (see Measure.save_measure_data frame_step), see _link_frames
+        """
+        if linker not in LINKERS: raise ValueError(f"Kdt.__init__() linker must be one of {list(LINKERS)}, got {linker}.")
         self.measure = measure
         self.measure_name = self.measure.get_name()
         self.vector_field_path = self.measure.get_vector_field_path()
-        self.measure_data = self.measure.load_measure_data(source='drive')
+        self.measure_store = self.measure.get_measure_store(source='drive')
         self.frame_center = self.measure.get_frame_center()
         self.source = Kdt.__name__
+        self.trees = OrderedDict() # frame name -> (centers, KDTree), least recently used first
+        self.linker = linker
+        self.predict = predict
+        self.trajectory_indices = None # linked on first use, see get_trajectory_indices
 
     def get_source_name(self):
         return self.source
@@ -23,54 +291,137 @@ class Kdt:
     def product_name(self, first_frame_name, second_frame_name):
         return create_product_name(self.measure_name, first_frame_name, second_frame_name, self.source)
     
+    def get_frame_centers(self, frame_name):
+        """(n, 2) float64 centers of a frame, an O(1) slice of the measure store"""
+        return np.asarray(self.measure_store.get_centers(frame_name), dtype=np.float64)
+
+    def get_frame_tree(self, frame_name):
+        """Centers and KDTree of a frame, kept in a small LRU cache so repeated pair queries do not rebuild the tree"""
+        if frame_name in self.trees:
+            self.trees.move_to_end(frame_name)
+        else:
+            centers = self.get_frame_centers(frame_name)
+            self.trees[frame_name] = (centers, KDTree(centers))
+            if len(self.trees) > TREES_CACHE_SIZE: self.trees.popitem(last=False)
+        return self.trees[frame_name]
+
     def match_particles(self, first_frame_name, second_frame_name):
-        frame1_centers = np.vstack(self.measure_data[self.measure_data["frame"] == first_frame_name]["centers"].to_numpy())
-        frame2_centers = np.vstack(self.measure_data[self.measure_data["frame"] == second_frame_name]["centers"].to_numpy())
+        frame1_centers = self.get_frame_centers(first_frame_name)
 
-        # Build KDTree on frame2 (the "destination" frame)
-        tree = KDTree(frame2_centers)
+        # KDTree on frame2 (the "destination" frame)
+        frame2_centers, tree = self.get_frame_tree(second_frame_name)
 
         # For each particle in frame1, find the closest in frame2
         distances, indices = tree.query(frame1_centers)
+        return _filter_matches(frame1_centers, frame2_centers, distances, indices)
+    
+    def get_trajectory_indices(self):
+        """Particle identities of the measurement, linking consecutive frames once (by the linker of this Kdt).
+        Rows follow the frames of the measure store, which may be every few frames of the measurement.
 
-        # Filter out bad matches
-        valid = distances < MAX_SINGLE_DISPLACEMENT
-        valid_indices = indices[valid]
-        matched_frame1 = frame1_centers[valid]
-        matched_frame2 = frame2_centers[valid_indices]
-        valid_distances = distances[valid]
-        
-        # Create displacement vectors
+        Returns:
+            np.ndarray: (frames, particles) index of every particle in each frame's centers, -1 where it is not detected
+        """
+        if self.trajectory_indices is None:
+            self.trajectory_indices = _link_frames([np.asarray(centers, dtype=np.float64) for centers in self.measure_store.get_frames_centers()],
+                                                   LINKERS[self.linker], predict=self.predict)
+        return self.trajectory_indices
+
+    def get_trajectories(self):
+        """(frames, particles, 2) positions of every particle identity in every frame, NaN where it is not detected"""
+        indices = self.get_trajectory_indices()
+        trajectories = np.full(indices.shape + (2,), np.nan)
+        for f, centers in enumerate(self.measure_store.get_frames_centers()):
+            detected = indices[f] >= 0
+            trajectories[f, detected] = centers[indices[f, detected]]
+        return trajectories
+
+    def match_particles_by_trajectories(self, first_frame_name, second_frame_name):
+        """Match the particles of two frames by their identities (see get_trajectory_indices) instead of by nearest neighbour,
+        which holds for distant frames too. Only particles tracked through all the frames between the two are matched.
+        Returns the same as match_particles"""
+        indices = self.get_trajectory_indices()
+        first_row = indices[self.measure_store.get_frame_index(first_frame_name)]
+        second_row = indices[self.measure_store.get_frame_index(second_frame_name)]
+        tracked = (first_row >= 0) & (second_row >= 0)
+        matched_frame1 = self.get_frame_centers(first_frame_name)[first_row[tracked]]
+        valid_indices = second_row[tracked]
+        matched_frame2 = self.get_frame_centers(second_frame_name)[valid_indices]
         displacements = matched_frame2 - matched_frame1
+        return matched_frame1, matched_frame2, np.linalg.norm(displacements, axis=1), valid_indices, displacements
 
-        return matched_frame1, matched_frame2, valid_distances, valid_indices, displacements
-    
-    def save_vector_field(self, first_frame_name, second_frame_name):
-        matched_frame1, matched_frame2, valid_distances, valid_indices, displacements = self.match_particles(first_frame_name, second_frame_name)
+    def get_vector_field(self, first_frame_name, second_frame_name):
+        """Vector field of two frames derived from the particle trajectories, without a saved file.
+
+        Returns:
+            dict: x, y, u, v arrays, like Plotter.load_vector_field
+        """
+        matched_frame1, _, _, _, displacements = self.match_particles_by_trajectories(first_frame_name, second_frame_name)
+        return {"x": matched_frame1[:, 0], "y": matched_frame1[:, 1], "u": displacements[:, 0], "v": displacements[:, 1]}
+
+    def save_vector_field(self, first_frame_name, second_frame_name, from_trajectories=False):
+        match = self.match_particles_by_trajectories if from_trajectories else self.match_particles
+        matched_frame1, matched_frame2, valid_distances, valid_indices, displacements = match(first_frame_name, second_frame_name)
+        self._write_vector_field(first_frame_name, second_frame_name, matched_frame1, displacements)
+
+    def _write_vector_field(self, first_frame_name, second_frame_name, matched_frame1, displacements):
         product_name = self.product_name(first_frame_name, second_frame_name)
-        
-        # Create a DataFrame with original positions and displacements
-        df = pd.DataFrame(np.hstack([matched_frame1, displacements]), columns=["x", "y", "u", "v"])
 
-        # Save to a text file (tab-separated or comma-separated)
-        df.to_csv(f"{self.vector_field_path}/{product_name}.txt", index=False, sep='\t')  # tab-separated
+        # Save original positions and displacements to a tab-separated text file
+        with open(f"{self.vector_field_path}/{product_name}.txt", "w") as vector_field_file:
+            vector_field_file.write(_format_vector_field(matched_frame1, displacements))
 
     
-    def run_all_vector_fields(self, source='local'):
+    def run_all_vector_fields(self, source='local', workers=1, from_trajectories=False, pair_selection=None):
+        """Save the vector field of the selected pairs of frames (i < j), every pair by default, see save_vector_field.
+        Each frame's tree is built once, and the particles of all its earlier frames are matched against it in a
+        single query, so the job is bounded by the queries instead of a tree build per pair.
+        The GUI derives Kdt vector fields from the trajectories on demand, so this precompute is only needed for
+        nearest neighbour fields.
+
+        Args:
+            source (str, optional): 'local' or 'drive' frames. Defaults to 'local'.
+            workers (int, optional): processes to split the pairs across, in chunks of destination frames with
+                balanced numbers of pairs. 1 runs in this process with the queries on all the cores,
+                None uses all the cores. Defaults to 1.
+            from_trajectories (bool, optional): derive the fields from the particle trajectories instead of matching
+                every pair by nearest neighbour, in this process. Defaults to False.
+            pair_selection (dict, optional): keyword arguments of select_frame_pairs, such as
+                {"mode": "band", "max_lag": 10}. Defaults to None, every pair.
+        """
         print(f"source: {source}")
         if source == 'local': frame_names = self.measure.get_frame_names()
-        elif source == 'drive': frame_names = sorted(file.name for file in self.measure.get_drive_path().iterdir() if file.is_file() and file.suffix.lower() == '.jpg')
+        elif source == 'drive': frame_names = self.measure.get_drive_frame_names()
         else: raise ValueError("source must be either 'local' or 'drive'")
-        for i in tqdm(range(len(frame_names))):
-            for j in range(i+1, len(frame_names)):
-                first_frame_name, second_frame_name = frame_names[i], frame_names[j]
-                self.save_vector_field(first_frame_name, second_frame_name)
+        stored_frames = set(self.measure_store.get_frame_names())
+        frame_names = [frame_name for frame_name in frame_names if frame_name in stored_frames] # data saved with a frame_step has only some frames
+        pairs = select_frame_pairs(len(frame_names), **(pair_selection or {}))
+        if not pairs: return
+        if workers is None: workers = os.cpu_count() or 1
+        with tqdm(total=len(pairs)) as progress:
+            if from_trajectories:
+                for i, j in pairs:
+                    self.save_vector_field(frame_names[i], frame_names[j], from_trajectories=True)
+                    progress.update(1)
+                return
+            destinations = _group_pairs(pairs)
+            if workers == 1:
+                _save_vector_fields(self.measure_store, frame_names, destinations, self.vector_field_path,
+                                    self.measure_name, self.source, query_workers=-1, progress=progress)
+                return
+            # the store pickles as its path, the workers memory map the same centers
+            chunks = _split_pairs(destinations, workers * PAIRS_CHUNKS_PER_WORKER)
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(_save_vector_fields, self.measure_store, frame_names[:chunk[-1][0] + 1], chunk,
+                                           self.vector_field_path, self.measure_name, self.source) for chunk in chunks]
+                for future in as_completed(futures):
+                    progress.update(future.result())
     
     
     def build_trajectories(self):
         """Build trajectories for each particle across frames"""
         # Efficiently pad centers arrays with 0 so all frames have the same number of particles
-        centers_arrays = [np.vstack(centers) for centers in self.measure_data['centers']]
+        centers_arrays = self.measure_store.get_frames_centers()
         max_particles = max(arr.shape[0] for arr in centers_arrays)
         # Preallocate output array with 0
         positions = np.full((len(centers_arrays), max_particles, 2), 0, dtype=float)
@@ -104,16 +455,17 @@ class Kdt:
 
         return trajectories
     
-    def build_trajectories_robust(self):
+    def build_trajectories_robust(self, linker=None):
         """
         Enhanced particle tracking with proper coordinate handling
+        @param linker: 'mutual' or 'assignment', see LINKERS. Defaults to the linker of this Kdt
         """
-        positions = self.measure_data['centers']
-        centers_arrays = [np.vstack(centers) for centers in positions]
+        match_fn = LINKERS[linker or self.linker]
+        centers_arrays = self.measure_store.get_frames_centers()
         
         # Calculate the mean center from all particle data
-        all_particles = np.vstack(centers_arrays)
-        mean_center = np.mean(all_particles, axis=0)
+        all_particles = self.measure_store.get_all_centers()
+        mean_center = np.mean(all_particles, axis=0, dtype=np.float64)
         
         print(f"Frame center from detector (x,y): {self.frame_center}")
         print(f"Calculated mean center (x,y): {mean_center}")
@@ -122,50 +474,36 @@ class Kdt:
         # self.frame_center is already in (x,y) format from OpenCV
         # particle centers should also be in (x,y) format
 
-        # Start with first frame (centered using mean center)
-        first_frame = centers_arrays[0] - mean_center  # Remove the coordinate swap
-        trajectories = [first_frame]
-        
-        for frame_idx in range(1, len(centers_arrays)):
-            prev_particles = trajectories[-1]
-            curr_particles = centers_arrays[frame_idx] - mean_center  # Use mean center consistently
-            
-            if len(prev_particles) == 0 or len(curr_particles) == 0:
-                trajectories.append(curr_particles)
-                continue
+        # Rows are written in place to a preallocated (frames, capacity, 2) buffer: a particle keeps its column, a lost
+        # particle keeps its last position and new particles take the next columns. The capacity grows geometrically,
+        # so the trajectories are not copied every frame.
+        result = np.zeros((len(centers_arrays), max(1, len(centers_arrays[0])), 2))
+        particles_num = 0 # columns in use in the previous row
+        max_particles = 0
+        for frame_idx, centers in enumerate(centers_arrays):
+            curr_particles = centers - mean_center  # Use mean center consistently
+            prev_particles = result[frame_idx - 1, :particles_num]
             
-            tree_curr = KDTree(curr_particles)
-            dist_forward, idx_forward = tree_curr.query(prev_particles)
+            if frame_idx == 0 or len(prev_particles) == 0 or len(curr_particles) == 0:
+                # nothing to link, the frame starts over from its own particles
+                prev_matched, curr_matched = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+                particles_num = 0
+            else:
+                prev_matched, curr_matched = match_fn(prev_particles, curr_particles)
             
-            tree_prev = KDTree(prev_particles)
-            dist_backward, idx_backward = tree_prev.query(curr_particles)
+            unmatched_curr = np.ones(len(curr_particles), dtype=bool)
+            unmatched_curr[curr_matched] = False
+            row_particles_num = particles_num + np.count_nonzero(unmatched_curr)
+            if row_particles_num > result.shape[1]:
+                grown = np.zeros((len(centers_arrays), max(row_particles_num, 2 * result.shape[1]), 2))
+                grown[:frame_idx, :result.shape[1]] = result[:frame_idx]
+                result = grown
             
-            valid_forward = dist_forward < MAX_SINGLE_DISPLACEMENT
-            mutual_matches = np.zeros(len(prev_particles), dtype=bool)
-            
-            for i, (valid, curr_idx) in enumerate(zip(valid_forward, idx_forward)):
-                if valid:
-                    if idx_backward[curr_idx] == i and dist_backward[curr_idx] < MAX_SINGLE_DISPLACEMENT:
-                        mutual_matches[i] = True
-            
-            new_positions = prev_particles.copy()
-            new_positions[mutual_matches] = curr_particles[idx_forward[mutual_matches]]
-            
-            matched_curr_indices = idx_forward[mutual_matches]
-            unmatched_curr = np.setdiff1d(np.arange(len(curr_particles)), matched_curr_indices)
-            
-            if len(unmatched_curr) > 0:
-                new_particles = curr_particles[unmatched_curr]
-                new_positions = np.vstack([new_positions, new_particles])
-            
-            trajectories.append(new_positions)
-        
-        # Convert to standard format
-        max_particles = max(len(traj) for traj in trajectories)
-        result = np.zeros((len(trajectories), max_particles, 2))
-        
-        for i, traj in enumerate(trajectories):
-            if len(traj) > 0:
-                result[i, :len(traj), :] = traj
+            row = result[frame_idx]
+            row[:particles_num] = result[frame_idx - 1, :particles_num]
+            row[prev_matched] = curr_particles[curr_matched]
+            row[particles_num:row_particles_num] = curr_particles[unmatched_curr]
+            particles_num = row_particles_num
+            max_particles = max(max_particles, particles_num)
         
-        return result
\ No newline at end of file
+        return result[:, :max_particles]
\ No newline at end of file
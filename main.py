@@ -14,4 +14,5 @@ def main():
     
     # test_detection(m)
     
-main()
\ No newline at end of file
+if __name__ == "__main__": # process pools re-import the main module in their workers
+    main()
\ No newline at end of file
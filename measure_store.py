@@ -0,0 +1,227 @@
+from pathlib import Path
+import shutil
+import numpy as np
+import pandas as pd
+
+STORE_CENTERS = "centers.npy" # (M, 2) float32, the centers of all the frames one after the other, in pixels
+STORE_RADII = "radii.npy" # (M,) float32, in pixels
+STORE_OFFSETS = "offsets.npy" # (N + 1,) int64, frame i owns rows offsets[i]:offsets[i + 1]
+STORE_FRAMES = "frames.npy" # (N,) frame names in format 'DSC_####.jpg'
+STORE_STATISTICS = "statistics.npy" # (N,) STATISTICS_DTYPE, see Detector.calculate_radii_statistics
+STORE_KEYS = "keys.npy" # (N,) keys of the inputs each frame was detected from, to tell stale frames
+STORE_COLUMNS = (STORE_CENTERS, STORE_RADII, STORE_OFFSETS, STORE_FRAMES, STORE_STATISTICS, STORE_KEYS)
+STORE_NEXT_SUFFIX = ".tmp" # the next store is written next to the store under this suffix, then swapped in
+STORE_REPLACED_SUFFIX = ".old" # the replaced store is moved aside under this suffix during the swap, then deleted
+STATISTICS_DTYPE = np.dtype([
+    ("num_detected", np.int32),
+    ("min_detected_radius", np.float64),
+    ("max_detected_radius", np.float64),
+    ("medium_radius", np.float64),
+    ("small_disks_num", np.int32),
+    ("large_disks_num", np.int32),
+    ("covered_detected_area", np.float64),
+    ("covered_area", np.float64),
+    ("areal_fraction", np.float64),
+])
+
+
+def _load_column(path: Path) -> np.ndarray:
+    try:
+        return np.load(path, mmap_mode='r')
+    except ValueError: # empty columns cannot be memory mapped
+        return np.load(path)
+
+
+class MeasureStore:
+    """Columnar measure data: the centers and radii of all the frames in flat arrays, with a CSR style
+    offsets array per frame and a typed statistics table. The columns are memory mapped, so opening a
+    measurement is near instant and a frame is an O(1) slice.
+    """
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        if not (self.path / STORE_OFFSETS).is_file():
+            raise FileNotFoundError(f"MeasureStore.__init__() no measure store at {self.path}.")
+        self._load()
+
+    def _load(self):
+        self.centers = _load_column(self.path / STORE_CENTERS)
+        self.radii = _load_column(self.path / STORE_RADII)
+        self.offsets = np.load(self.path / STORE_OFFSETS)
+        self.frame_names = np.load(self.path / STORE_FRAMES).tolist()
+        self.frame_indices = {frame_name: i for i, frame_name in enumerate(self.frame_names)}
+        self.statistics = _load_column(self.path / STORE_STATISTICS)
+        keys_path = self.path / STORE_KEYS
+        self.keys = np.load(keys_path).tolist() if keys_path.is_file() else [""] * len(self.frame_names)
+
+    def __getstate__(self):
+        # pickling a memmap copies its data, process pool workers map the columns again instead
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.frame_names)
+
+    def get_path(self) -> Path:
+        return self.path
+
+    def get_frame_names(self) -> list:
+        return list(self.frame_names)
+
+    def get_frame_index(self, frame) -> int:
+        """Get the row of a frame in the store.
+
+        Args:
+            frame (str | int): frame name in format 'DSC_####.jpg', or a frame index that is returned as is
+
+        Returns:
+            int: the frame index
+        """
+        if isinstance(frame, str):
+            if frame not in self.frame_indices:
+                raise KeyError(f"MeasureStore.get_frame_index() frame {frame} is not in the store at {self.path}.")
+            return self.frame_indices[frame]
+        return int(frame)
+
+    def get_offsets(self) -> np.ndarray:
+        return self.offsets
+
+    def get_all_centers(self) -> np.ndarray:
+        """(M, 2) centers of all the frames, use get_offsets to split them"""
+        return self.centers
+
+    def get_all_radii(self) -> np.ndarray:
+        return self.radii
+
+    def get_centers(self, frame) -> np.ndarray:
+        """(n, 2) read only view of the centers of a frame (name or index), in pixels"""
+        i = self.get_frame_index(frame)
+        return self.centers[self.offsets[i]:self.offsets[i + 1]]
+
+    def get_radii(self, frame) -> np.ndarray:
+        """(n,) read only view of the radii of a frame (name or index), in pixels"""
+        i = self.get_frame_index(frame)
+        return self.radii[self.offsets[i]:self.offsets[i + 1]]
+
+    def get_statistics(self) -> np.ndarray:
+        """(N,) STATISTICS_DTYPE table, one row per frame"""
+        return self.statistics
+
+    def get_statistic(self, frame) -> dict:
+        """Statistics of a frame (name or index), in the format of Detector.calculate_radii_statistics"""
+        row = self.statistics[self.get_frame_index(frame)]
+        return dict(zip(STATISTICS_DTYPE.names, row.tolist()))
+
+    def get_keys(self) -> list:
+        """Keys of the inputs each frame was detected from, in frame order, empty for stores written without keys"""
+        return list(self.keys)
+
+    def get_record(self, frame) -> dict:
+        """Detection record of a frame (name or index), in the format write_measure_store takes"""
+        i = self.get_frame_index(frame)
+        return {"frame": self.frame_names[i],
+                "centers": self.get_centers(i),
+                "radii": self.get_radii(i),
+                "statistic": self.get_statistic(i),
+                "key": self.keys[i]
+                }
+
+    def get_frames_centers(self) -> list:
+        """Per frame (n, 2) views of the centers, in frame order"""
+        return np.split(self.centers, self.offsets[1:-1])
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """The store in the per-frame DataFrame format of the former pickled measure data (frame, centers, radii, statistic)"""
+        return pd.DataFrame({
+            "frame": self.frame_names,
+            "centers": self.get_frames_centers(),
+            "radii": np.split(self.radii, self.offsets[1:-1]),
+            "statistic": [self.get_statistic(i) for i in range(len(self))],
+        })
+
+
+def _build_columns(records: list) -> tuple:
+    counts = [len(record["radii"]) for record in records]
+    offsets = np.zeros(len(records) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    centers = np.zeros((offsets[-1], 2), dtype=np.float32)
+    radii = np.zeros(offsets[-1], dtype=np.float32)
+    statistics = np.zeros(len(records), dtype=STATISTICS_DTYPE)
+    for i, record in enumerate(records):
+        centers[offsets[i]:offsets[i + 1]] = np.reshape(record["centers"], (-1, 2))
+        radii[offsets[i]:offsets[i + 1]] = record["radii"]
+        statistics[i] = tuple(record["statistic"][name] for name in STATISTICS_DTYPE.names)
+    frame_names = np.array([record["frame"] for record in records], dtype=str)
+    keys = np.array([record.get("key", "") for record in records], dtype=str)
+    return centers, radii, offsets, frame_names, statistics, keys
+
+
+def recover_measure_store(path: Path):
+    """Finish a store swap a crash interrupted, see _write_columns.
+    The next store is complete once the replaced store is moved aside, so it is swapped in,
+    and a replaced store left behind (its memory maps were still open on Windows) is deleted.
+
+    Args:
+        path (Path): folder of the store
+    """
+    path = Path(path)
+    next_path, replaced_path = path.with_name(path.name + STORE_NEXT_SUFFIX), path.with_name(path.name + STORE_REPLACED_SUFFIX)
+    if not path.exists() and replaced_path.exists():
+        (next_path if next_path.exists() else replaced_path).rename(path)
+    if replaced_path.exists(): shutil.rmtree(replaced_path, ignore_errors=True)
+
+
+def _write_columns(columns: tuple, path: Path) -> MeasureStore:
+    # write the next store in full before touching the store, then swap it in with two renames,
+    # a crash leaves either store whole and recover_measure_store finishes the swap
+    recover_measure_store(path)
+    next_path, replaced_path = path.with_name(path.name + STORE_NEXT_SUFFIX), path.with_name(path.name + STORE_REPLACED_SUFFIX)
+    if next_path.exists(): shutil.rmtree(next_path)
+    next_path.mkdir(parents=True)
+    for column, array in zip(STORE_COLUMNS, columns):
+        np.save(next_path / column, array)
+    if path.exists(): path.rename(replaced_path)
+    next_path.rename(path)
+    shutil.rmtree(replaced_path, ignore_errors=True)
+    return MeasureStore(path)
+
+
+def write_measure_store(records: list, path: Path) -> MeasureStore:
+    """Write detection records to a columnar measure store, replacing any store at path.
+
+    Args:
+        records (list): per-frame dicts with frame, centers, radii, statistic and optionally key, in frame order
+        path (Path): folder of the store
+
+    Returns:
+        MeasureStore: the written store
+    """
+    return _write_columns(_build_columns(records), Path(path))
+
+
+def _merged_columns(paths: list, frame_names: list) -> tuple:
+    latest = {}
+    for store_path in paths:
+        if (Path(store_path) / STORE_OFFSETS).is_file():
+            store = MeasureStore(store_path)
+            latest.update((frame_name, (store, i)) for i, frame_name in enumerate(store.frame_names))
+    if frame_names is None: frame_names = sorted(latest)
+    return _build_columns([latest[frame_name][0].get_record(latest[frame_name][1]) for frame_name in frame_names if frame_name in latest])
+
+
+def merge_measure_stores(paths: list, path: Path, frame_names: list = None) -> MeasureStore:
+    """Merge measure stores into one, replacing any store at path (which may be one of the merged stores).
+    A frame stored more than once is taken from the last store that has it.
+
+    Args:
+        paths (list): folders of the stores to merge, missing stores are skipped
+        path (Path): folder of the merged store
+        frame_names (list, optional): frames to keep, in this order, frames no store has are skipped.
+            Defaults to all the stored frames, sorted.
+
+    Returns:
+        MeasureStore: the merged store
+    """
+    return _write_columns(_merged_columns(paths, frame_names), Path(path)) # the memory maps of the merged stores are released on return
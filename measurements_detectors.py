@@ -1,6 +1,15 @@
-from detection_lib import CenterDisk, Configuration, Detector, cv2, np, Path, PIXEL_TO_MM_RATIO
+from detection_lib import CenterDisk, Configuration, Detector, cv2, np, Path, PIXEL_TO_MM_RATIO, DETECTION_VERSION
+from frame_sources import (CachedFrameSource, FolderFrameSource, FrameManifest, FrameSource, MemmapFrameSource, open_frame_source,
+                           prefetch_frames, write_memmap_stack, PREFETCH_FRAMES)
+from measure_store import MeasureStore, merge_measure_stores, recover_measure_store, write_measure_store, STORE_NEXT_SUFFIX
 from matplotlib import pyplot as plt
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import json
+import os
 import pandas as pd
+import shutil
+import time
 from tqdm import tqdm
 
 BASE_PATH = (Path(__file__).parent / "measurements").resolve()
@@ -9,6 +18,8 @@ BW = "bw"
 DOT = "dot"
 VECTOR_FIELD = "vector_field"
 GRAPH = "graph"
+FRAME_CACHE = "frame_cache"
+FRAME_CACHE_SIZE = 8 * 2**30 # bytes of local disk the drive frames cache may use
 
 # DRIVE_PATH = Path(r"G:\My Drive\מעבדג\פוטואלסטיות(שוב)\מדידות")
 DRIVE_PATH = Path(r"G:\My Drive\mabadag\photoelasticity(again)\measurements")
@@ -79,6 +90,110 @@ CONFIGURES = {
     "26.01.25": configure_260125
 }
 
+CHUNKS_PER_WORKER = 4 # more chunks than workers keeps the pool busy when some frames are slower
+FULL_DETECTION_EVERY = 50 # frames, incremental detection restarts from a full detection to bound drift
+ARTIFACTS = ("bw", "dot", "data") # black and white images, dot images and the measure data
+CHECKPOINT_EVERY = FULL_DETECTION_EVERY # frames, the measure data is checkpointed at least this often (where incremental detection restarts anyway)
+IMAGE_KEYS = "keys.json" # frame name -> key of the inputs each image in a bw or dot folder was made from
+
+
+def _detection_record(detector: Detector, prev_circles: np.ndarray = None, pyramid_scale: int = None) -> dict:
+    """Run the detection pipeline on the current frame of the detector.
+
+    Args:
+        detector (Detector): detector already set to the frame to process
+        prev_circles (np.ndarray, optional): circles of the previous frame to seed an incremental detection.
+            Defaults to None, a full detection.
+        pyramid_scale (int, optional): run full detections coarse to fine at this resolution reduction
+            (see Detector.detect_disks_pyramid). Defaults to None, a full resolution detection.
+
+    Returns:
+        dict: the per-frame row of the measure data (frame, centers, radii, statistic)
+    """
+    if prev_circles is None and pyramid_scale is None:
+        centers, radii, statistics = detector.detect_disks_headless(with_statistics=True) # in pixels
+    elif prev_circles is None:
+        centers, radii, statistics = detector.detect_disks_pyramid(scale=pyramid_scale, with_statistics=True) # in pixels
+    else:
+        centers, radii, statistics = detector.detect_disks_incremental(prev_circles, with_statistics=True) # in pixels
+    return {"frame": detector.get_frame_name(),
+            "centers": centers,
+            "radii": radii,
+            "statistic": statistics
+            }
+
+
+def _process_frames(detector: Detector, frame_names: list, artifacts: tuple = ("data",), bw_path: Path = None, dot_path: Path = None,
+                    incremental: bool = False, pyramid_scale: int = None, progress: tqdm = None, first_decoded: bool = False) -> list:
+    """Decode each frame once and emit the requested artifacts from the same intermediate arrays
+    (the black and white image of the detection and its circles).
+
+    Args:
+        detector (Detector): detector to run
+        frame_names (list): frame names in format 'DSC_####.jpg', in frame order
+        artifacts (tuple, optional): which of ARTIFACTS to emit. Defaults to ("data",).
+        bw_path (Path, optional): folder to save the black and white images to, required for "bw". Defaults to None.
+        dot_path (Path, optional): folder to save the dot images to, required for "dot". Defaults to None.
+        incremental (bool, optional): seed each frame with the previous frame's circles,
+            with a full detection every FULL_DETECTION_EVERY frames. Defaults to False.
+        pyramid_scale (int, optional): see _detection_record. Defaults to None.
+        progress (tqdm, optional): progress bar to update per frame. Defaults to None.
+        first_decoded (bool, optional): the detector was just created on frame_names[0], so its image is not decoded
+            again. A detector kept from earlier may hold an image the frame source has since replaced. Defaults to False.
+
+    Returns:
+        list: detection records in the order of frame_names, empty if "data" is not in artifacts
+    """
+    detect = "data" in artifacts or "dot" in artifacts
+    records = []
+    prev_circles = None
+    # the next frames are decoded on background threads while the current one is processed
+    frames = prefetch_frames(detector.get_frame_source(), frame_names[1:] if first_decoded else frame_names, detector.get_read_flag())
+    for i, frame_name in enumerate(frame_names):
+        if i > 0 or not first_decoded:
+            _, image = next(frames)
+            detector.set_frame(frame_name, image)
+        if detect:
+            use_prior = incremental and prev_circles is not None and i % FULL_DETECTION_EVERY != 0
+            record = _detection_record(detector, prev_circles if use_prior else None, pyramid_scale)
+            if "data" in artifacts: records.append(record)
+            prev_circles = detector.get_circles()
+        if "bw" in artifacts: cv2.imwrite(str((bw_path / frame_name).resolve()), detector.get_black_white_image())
+        if "dot" in artifacts: cv2.imwrite(str((dot_path / frame_name).resolve()), detector.get_dot_image())
+        if progress is not None: progress.update(1)
+    return records
+
+
+def _process_frames_chunk(frame_source: FrameSource, frame_names: list, configure: Configuration, engine: str, options: dict) -> list:
+    """Process a contiguous chunk of frames on a private headless Detector, in a process pool worker or in the serial batch.
+    Chunks can run concurrently in separate processes.
+
+    Args:
+        frame_source (FrameSource): source of the frames
+        frame_names (list): frame names in format 'DSC_####.jpg', in frame order
+        configure (Configuration): configuration of the measurement
+        engine (str): detection engine of the detector, one of DETECTION_ENGINES
+        options (dict): keyword arguments of _process_frames, an incremental chunk starts with a full detection
+
+    Returns:
+        list: detection records in the order of frame_names
+    """
+    detector = Detector(frame_source.get_path(), frame_names[0], configure, headless=True, engine=engine, frame_source=frame_source)
+    return _process_frames(detector, frame_names, first_decoded=True, **options)
+
+
+def _hash_key(*inputs) -> str:
+    """Content addressed key of a saved result, a hash of everything the result was made from."""
+    return hashlib.sha1(repr(inputs).encode()).hexdigest()[:16]
+
+
+def _split_to_chunks(items: list, chunks_num: int) -> list:
+    """Split a list to at most chunks_num contiguous chunks of balanced sizes."""
+    chunks_num = max(1, min(chunks_num, len(items)))
+    bounds = np.linspace(0, len(items), chunks_num + 1).astype(int)
+    return [items[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
 class Measure:
     """This class represents a Measurement object, which include the data taken from the lab.
     """
@@ -89,6 +204,10 @@ class Measure:
             measurement_name (str): The name of the measurement. It should be one of the keys in CONFIGURES, in the format 'dd.mm.yy'.
             path_setting (str, optional): The path setting for the measurement. It can be 'local', 'drive' or 'manual'. Defaults to 'local'.
             **kwargs: Additional keyword arguments. If path_setting is 'manual', a dictionary with the paths must be provided under the key 'manual_path_dict'.
+                A video container or image stack file (or a FrameSource) to read the frames from instead of the raw data folder
+                can be provided under the key 'frame_source'.
+                Frames read from a folder are copied through a local read-through cache (see CachedFrameSource) when
+                'frame_cache' is True, or a folder to keep the cache in. Defaults to caching only with path_setting 'drive'.
             Raises:
                 ValueError: If the measurement name is not in CONFIGURES or if the path_setting is not one of 'local', 'drive', or 'manual'.
         """
@@ -96,9 +215,20 @@ class Measure:
         self.path_setting = path_setting
         self.drive_path = (DRIVE_PATH / f"{self.name}").resolve()
         self.set_path_config(kwargs.get('manual_path_dict', None))
-        self.frame_names = sorted(file.name for file in self.raw_data_path.iterdir() if file.is_file() and file.suffix.lower() == '.jpg')
-        self.total_frames_num = sum(1 for _ in self.drive_path.glob("*.jpg"))
-        self.detector = Detector(self.raw_data_path, self.frame_names[0], CONFIGURES[measurement_name])
+        self.frame_source = open_frame_source(kwargs.get('frame_source', self.raw_data_path), manifest_path=self._get_manifest_path(self.path_setting))
+        frame_cache = kwargs.get('frame_cache', self.path_setting == 'drive')
+        if frame_cache and isinstance(self.frame_source, FolderFrameSource):
+            cache_path = frame_cache if isinstance(frame_cache, (str, Path)) else self.path / FRAME_CACHE
+            self.frame_source = CachedFrameSource(self.frame_source, cache_path, FRAME_CACHE_SIZE)
+        self.frame_names = self.frame_source.get_frame_names()
+        self.drive_manifest = None
+        if 'frame_source' in kwargs: self.total_frames_num = len(self.frame_names)
+        else: self.total_frames_num = self.get_drive_manifest().get_frames_num()
+        self.configure = CONFIGURES[measurement_name]
+        # built or loaded on first use and shared by everything that uses the measurement (Kdt, Piv, the GUI windows)
+        self.detector = None
+        self.measure_stores = {} # source -> MeasureStore
+        self.measure_data_frames = {} # source -> DataFrame
     
     def set_path_config(self, manual_path_dict: dict = None) -> None:
 
@@ -126,6 +256,29 @@ class Measure:
         self.vector_field_path = (self.path / VECTOR_FIELD).resolve()
         self.graph_path = (self.path / GRAPH).resolve()
         
+    def _get_manifest_path(self, source: str) -> Path:
+        return (self.path / f"manifest_{source}_{self.name}.json").resolve()
+
+    def get_drive_manifest(self) -> FrameManifest:
+        """Get the persisted listing of the measurement frames on the drive, refreshed if frames were added or removed.
+
+        Returns:
+            FrameManifest: names, sizes, modification times and frame numbers of the drive frames
+        """
+        if self.drive_manifest is None:
+            self.drive_manifest = FrameManifest(self.drive_path, self._get_manifest_path('drive'))
+        else:
+            self.drive_manifest.refresh()
+        return self.drive_manifest
+
+    def get_drive_frame_names(self) -> list:
+        """Get the names of the measurement frames on the drive, without listing the drive folder when it did not change.
+
+        Returns:
+            list: sorted list of frame names in format 'DSC_####.jpg'
+        """
+        return self.get_drive_manifest().get_frame_names()
+
     def get_name(self) -> str:
         """Get the name of the measurement.
 
@@ -135,13 +288,34 @@ class Measure:
         return self.name
 
     def get_detector(self) -> Detector:
-        """Get the measurement detector object.
+        """Get the measurement detector object, built (and its first frame decoded) on first use.
 
         Returns:
             Detector: measurement detector
         """
+        if self.detector is None:
+            detector = Detector(self.raw_data_path, self.frame_names[0], self.configure, frame_source=self.frame_source)
+            if isinstance(self.frame_source, MemmapFrameSource) and self.frame_source.get_roi() != detector.get_roi():
+                raise ValueError(f"the frame stack at {self.frame_source.get_path()} was cropped with another configuration, create it again")
+            self.detector = detector
         return self.detector
+
+    def get_configure(self) -> Configuration:
+        """Get the configuration of the measurement, without building the detector.
+
+        Returns:
+            Configuration: measurement configuration
+        """
+        return self.configure
     
+    def get_frame_source(self) -> FrameSource:
+        """Get the source the measurement frames are read from.
+
+        Returns:
+            FrameSource: raw data folder, video container or image stack of the frames
+        """
+        return self.frame_source
+
     def get_path(self) -> Path:
         """Get the path of the measurement.
 
@@ -189,6 +363,21 @@ class Measure:
             list: list of frame names in format 'DSC_####.jpg'
         """
         return self.frame_names
+
+    def iter_frames(self, frame_names: list = None, flags: int = cv2.IMREAD_COLOR, folder: Path = None, ahead: int = PREFETCH_FRAMES):
+        """Decode frames ahead on a thread pool while the caller processes the current one, see prefetch_frames.
+
+        Args:
+            frame_names (list, optional): frame names in format 'DSC_####.jpg', in the order to yield them. Defaults to all the frames.
+            flags (int, optional): cv2.imread flags. Defaults to cv2.IMREAD_COLOR.
+            folder (Path, optional): folder of frames to read instead of the measurement frames, such as the dot folder. Defaults to None.
+            ahead (int, optional): frames decoded ahead, bounding the memory used. Defaults to PREFETCH_FRAMES.
+
+        Yields:
+            tuple: (frame_name, frame)
+        """
+        frame_source = self.frame_source if folder is None else FolderFrameSource(folder)
+        yield from prefetch_frames(frame_source, self.frame_names if frame_names is None else frame_names, flags, ahead)
     
     def get_total_frames_num(self) -> int:
         """Get the total number of frames in the measurement (using Google drive folder).
@@ -204,7 +393,7 @@ class Measure:
         Returns:
             float: center disk radius in pixels for this measurement
         """
-        return self.detector.get_center_disk_radius()
+        return self.configure.get_center_disk_radius()
     
     def get_frame_center(self) -> tuple:
         """Get the center of the frame.
@@ -212,92 +401,74 @@ class Measure:
         Returns:
             tuple: (center_x, center_y) of the frame in pixels
         """
-        return self.detector.get_frame_center()
+        return self.get_detector().get_frame_center()
     
     def save_bw_version(self, frame_name: str) -> np.ndarray:
-        """_summary_
+        """Save the black and white version of a frame, the image the disks are detected in.
 
         Args:
-            frame_name (str): _description_
+            frame_name (str): frame name in format 'DSC_####.jpg'
 
         Returns:
-            np.ndarray: _description_
+            np.ndarray: the black and white frame
         """
-        # prev_capture = self.detector.get_capture()
-        # self.detector.change_capture(frame_name)
-        config = self.detector.get_configure()
-        
-        # Load frame
-        frame_path = (self.raw_data_path / frame_name).resolve()
-        frame = cv2.imread(str(frame_path), cv2.IMREAD_COLOR)
-
-        # Convert the image to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # crop the outer frame
-        outer_mask, outer_crop_center, outer_crop_radius = self.detector._create_outer_crop_mask(gray)
-        cv2.circle(outer_mask, outer_crop_center, outer_crop_radius, 255, -1)
-        
-        #crop center disk
-        center_disk_mask, center_disk_center, center_disk_radius = self.detector._create_inner_mask(outer_crop_center, gray)
-        cv2.circle(center_disk_mask, center_disk_center, int(center_disk_radius), 255, -1)
-        
-        # Apply the mask to isolate the region inside the ring
-        masked_gray_image = cv2.bitwise_and(gray, gray, mask=outer_mask)
-        masked_gray_image = cv2.bitwise_not(masked_gray_image, masked_gray_image, mask=center_disk_mask)
-        
-        # Convert to Black & White
-        mask_thresh = config.get_mask_thresh()
-        black_white_image = cv2.threshold(masked_gray_image, mask_thresh, 255, cv2.THRESH_BINARY)[1]
-
-        # Save black and white version
-        # self.detector.set_capture(prev_capture)
+        self.get_detector().set_frame(frame_name)
+        black_white_image = self.get_detector().get_black_white_image()
         output_path = (self.bw_path / frame_name).resolve()
         cv2.imwrite(str(output_path), black_white_image)
         return black_white_image
 
-    def save_dot_version(self, frame_name: str):
-        # prev_capture = self.detector.get_capture()
-        # self.detector.change_capture(frame_name)
-        self.detector.detect_disks()
-        disk_pos = self.detector.get_circles_positions()
-        height, width = self.detector.get_frame_sizes()
-        # Create a black image
-        dotted_image = np.zeros((height, width))
-        for center in disk_pos:
-            dotted_image = cv2.circle(dotted_image, center, 3, 255, -1)
-        # save dotted version
-        # self.detector.set_capture(prev_capture)
+    def create_frame_stack(self) -> Path:
+        """Convert the frames to a single memory mapped stack of grayscale frames cropped to the detector roi.
+        Measures opened with frame_source=<stack path> read frames from the stack with no JPEG decode.
+
+        Returns:
+            Path: path to the stack folder
+        """
+        stack_path = (self.path / f"stack_{self.path_setting}_{self.name}").resolve()
+        write_memmap_stack(self.frame_source, stack_path, self.get_detector().get_roi(), self.get_detector().get_frame_sizes(), self.frame_names)
+        return stack_path
+
+    def save_dot_version(self, frame_name: str) -> np.ndarray:
+        """Save the dot version of a frame, a black frame with a white dot at the center of every detected disk.
+
+        Args:
+            frame_name (str): frame name in format 'DSC_####.jpg'
+
+        Returns:
+            np.ndarray: the dot frame
+        """
+        self.get_detector().set_frame(frame_name)
+        self.get_detector().detect_disks_headless()
+        dotted_image = self.get_detector().get_dot_image()
         output_path = (self.dot_path / frame_name).resolve()
         cv2.imwrite(str(output_path), dotted_image)
         return dotted_image
            
-    def create_bw_versions(self):
-        # create dotted versions
-        for frame in tqdm(self.frame_names):
-            self.save_bw_version(frame)
+    def create_bw_versions(self, workers=1):
+        """Save the black and white version of every frame, see create_artifacts."""
+        self.create_artifacts(("bw",), source=self.path_setting, workers=workers)
     
-    def create_dot_versions(self):
-        # create dotted versions
-        for frame in tqdm(self.frame_names):
-            self.save_dot_version(frame)
+    def create_dot_versions(self, workers=1):
+        """Save the dot version of every frame, see create_artifacts."""
+        self.create_artifacts(("dot",), source=self.path_setting, workers=workers)
 
     def test_detector(self, save_fig=False, control_print=False, print_stat=False):
         """Test the detector on the first frame of the measurement."""
-        frame_with_circles = self.detector.detect_disks(test_mode=True, show_control_print=control_print, print_stat=print_stat)
-        if save_fig: cv2.imwrite(str((self.path / "tests").resolve()) + f"/{self.detector.get_frame_name()[0:-4]}.png", frame_with_circles)
+        frame_with_circles = self.get_detector().detect_disks(test_mode=True, show_control_print=control_print, print_stat=print_stat)
+        if save_fig: cv2.imwrite(str((self.path / "tests").resolve()) + f"/{self.get_detector().get_frame_name()[0:-4]}.png", frame_with_circles)
     
     def get_measure_statistics(self):
-        self.detector.set_frame(self.frame_names[0])
-        self.detector.detect_disks(test_mode=False)
-        return self.detector.calculate_radii_statistics()
+        self.get_detector().set_frame(self.frame_names[0])
+        self.get_detector().detect_disks(test_mode=False)
+        return self.get_detector().calculate_radii_statistics()
 
     def calculate_area_fraction_change(self):
         area_fracs = []
         for frame_name in self.frame_names:
-            self.detector.change_capture(frame_name)
-            self.detector.detect_disks(test_mode=False)
-            data = self.detector.calculate_radii_statistics()
+            self.get_detector().change_capture(frame_name)
+            self.get_detector().detect_disks(test_mode=False)
+            data = self.get_detector().calculate_radii_statistics()
             area_fracs.append(data["areal_fraction"])
         return np.arange(len(self.frame_names)), np.array(area_fracs)
 
@@ -310,34 +481,227 @@ class Measure:
         ax.set_title(f"Area fraction changes in frames of {self.name}")
         plt.show()
 
-    def save_measure_data(self, source='local'):
+    def _process_frames_parallel(self, frames_list: list, workers: int, on_chunk, engine: str = "hough", **options):
+        """Shard the frames to contiguous chunks and process them on a process pool.
+
+        Args:
+            frames_list (list): frame names in format 'DSC_####.jpg', in frame order
+            workers (int): number of worker processes
+            on_chunk (callable): called with the frame names and the detection records of every chunk as soon as it finishes
+            engine (str, optional): detection engine of the workers' detectors. Defaults to "hough".
+            **options: keyword arguments of _process_frames
+        """
+        configure = self.configure
+        chunks = _split_to_chunks(frames_list, max(workers * CHUNKS_PER_WORKER, -(-len(frames_list) // CHECKPOINT_EVERY)))
+        with ProcessPoolExecutor(max_workers=workers) as executor, tqdm(total=len(frames_list)) as progress:
+            futures = {executor.submit(_process_frames_chunk, self.frame_source, chunk, configure, engine, options): i for i, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                chunk = chunks[futures[future]]
+                on_chunk(chunk, future.result())
+                progress.update(len(chunk))
+
+    def _get_checkpoints_path(self, source: str) -> Path:
+        store_path = self._get_measure_store_path(source)
+        return store_path.with_name(store_path.name + ".parts")
+
+    def _get_checkpoints(self, source: str) -> list:
+        """Checkpoint stores in the order they were written, without ones interrupted while written."""
+        checkpoints_path = self._get_checkpoints_path(source)
+        if not checkpoints_path.is_dir(): return []
+        return sorted(path for path in checkpoints_path.iterdir() if path.is_dir() and path.suffix != STORE_NEXT_SUFFIX)
+
+    def _get_image_folder(self, artifact: str) -> Path:
+        return self.bw_path if artifact == "bw" else self.dot_path
+
+    def _load_stored_keys(self, artifact: str, source: str) -> dict:
+        """Keys of the saved results of an artifact, frame name -> key."""
+        if artifact == "data":
+            stored_keys = {}
+            store_path = self._get_measure_store_path(source)
+            for path in ([store_path] if store_path.is_dir() else []) + self._get_checkpoints(source):
+                store = MeasureStore(path)
+                stored_keys.update(zip(store.get_frame_names(), store.get_keys()))
+            return stored_keys
+        keys_path = self._get_image_folder(artifact) / IMAGE_KEYS
+        if not keys_path.is_file(): return {}
+        with open(keys_path, "r") as keys_file:
+            return json.load(keys_file)
+
+    def _save_image_keys(self, artifact: str, keys: dict):
+        keys_path = self._get_image_folder(artifact) / IMAGE_KEYS
+        tmp_path = keys_path.with_name(keys_path.name + ".tmp")
+        with open(tmp_path, "w") as keys_file:
+            json.dump(keys, keys_file)
+        os.replace(tmp_path, keys_path)
+
+    def _get_artifacts_keys(self, frames_list: list, artifacts: tuple, engine: str, incremental: bool, pyramid_scale: int) -> dict:
+        """Content addressed keys of the requested artifacts of every frame, hashing the inputs each artifact is made from:
+        the file identity of the frame (size and modification time, from the frame manifest when the source has one,
+        refreshed by create_artifacts), the configuration, and for the dot images and the detections also
+        the detection parameters.
+
+        Returns:
+            dict: artifact -> frame name -> key
+        """
+        image_inputs = (DETECTION_VERSION, self.configure.get_key())
+        detection_inputs = image_inputs + (engine, incremental, pyramid_scale)
+        inputs = {"bw": image_inputs, "dot": detection_inputs, "data": detection_inputs}
+        keys = {artifact: {} for artifact in artifacts}
+        for frame_name in frames_list:
+            frame_stat = self.frame_source.get_frame_stat(frame_name)
+            for artifact in artifacts:
+                keys[artifact][frame_name] = _hash_key(inputs[artifact], frame_name, frame_stat)
+        return keys
+
+    def _get_pending_frames(self, frames_list: list, artifacts: tuple, keys: dict, stored_keys: dict) -> list:
+        """Frames with a requested artifact missing or stale: no image saved, or a result saved with another key."""
+        pending = []
+        for frame_name in frames_list:
+            for artifact in artifacts:
+                if (stored_keys[artifact].get(frame_name) != keys[artifact][frame_name]
+                        or (artifact != "data" and not (self._get_image_folder(artifact) / frame_name).is_file())):
+                    pending.append(frame_name)
+                    break
+        return pending
+
+    def _consolidate_checkpoints(self, source: str, frames_list: list, resume: bool):
+        """Merge the checkpoints into the measure store and remove them."""
+        store_path = self._get_measure_store_path(source)
+        checkpoints_path = self._get_checkpoints_path(source)
+        checkpoints = self._get_checkpoints(source)
+        if not checkpoints and store_path.is_dir() and MeasureStore(store_path).get_frame_names() == list(frames_list):
+            return
+        self._forget_measure_data(source)
+        merge_measure_stores(([store_path] if resume else []) + checkpoints, store_path, frame_names=frames_list)
+        if checkpoints_path.is_dir(): shutil.rmtree(checkpoints_path)
+
+    def create_artifacts(self, artifacts=ARTIFACTS, source='local', workers=1, incremental=False, pyramid_scale=None, engine="hough", resume=True,
+                         frame_step=1):
+        """Process every frame in a single pass: each frame is decoded once, and its black and white image,
+        dot image and detection record are emitted from the same intermediate arrays.
+        The detection records are checkpointed next to the measure store as chunks of frames finish, so an
+        interrupted run loses at most the chunks in flight.
+
+        Args:
+            artifacts (tuple, optional): which of ARTIFACTS to create, "bw" and "dot" are saved to the bw and dot folders,
+                "data" is written as the measure store (see load_measure_store). Defaults to ARTIFACTS.
+            source (str, optional): 'local', 'drive' or 'manual', must match the path_setting. Defaults to 'local'.
+            workers (int, optional): number of processes to shard the frames across. 1 runs serially
+                with the measure detector, None uses all the cores. Defaults to 1.
+            incremental (bool, optional): seed each frame with the previous frame's circles and run
+                HoughCircles only where disks were lost or appeared (see Detector.detect_disks_incremental).
+                Defaults to False.
+            pyramid_scale (int, optional): run the full detections coarse to fine, first on the frame decoded
+                at 1/pyramid_scale resolution (see Detector.detect_disks_pyramid). Defaults to None.
+            engine (str, optional): circles detection engine, one of DETECTION_ENGINES. Defaults to "hough".
+            resume (bool, optional): skip frames whose requested artifacts are already saved from the same inputs:
+                the same file (size and modification time), configuration and detection parameters, see _get_artifacts_keys.
+                After a change to the configuration only the artifacts it affects are made again.
+                False processes every frame again. Defaults to True.
+            frame_step (int, optional): process every frame_step-th frame only, such as every 5th frame of a slow
+                inflation (see Kdt predict to track them). They are added to the measure store, which keeps the
+                other frames it has. Defaults to 1.
+        """
+        if not set(artifacts) <= set(ARTIFACTS):
+            raise ValueError(f"artifacts must be a subset of {ARTIFACTS}")
         if not (self.path_setting == 'manual' or source == self.path_setting):
             raise ValueError("source must be either 'local' or 'drive' and must match the path_setting of the Measure object")
-        df_data = []
         if source == 'local': frames_list = self.frame_names
-        elif source == 'drive': frames_list = sorted(file.name for file in self.drive_path.iterdir() if file.is_file() and file.suffix.lower() == '.jpg')
-        elif source == 'manual': frames_list = sorted(file.name for file in self.raw_data_path.iterdir() if file.is_file() and file.suffix.lower() == '.jpg')
+        elif source in ('drive', 'manual'): frames_list = self.frame_source.get_frame_names() # list again, frames may have been added
         else: raise ValueError("source must be either 'local' or 'drive'")
-        for frame_name in tqdm(frames_list):
-            self.detector.set_frame(frame_name)
-            self.detector.detect_disks()
-            centers = self.detector.get_circles_positions() # in pixels
-            radii = self.detector.get_circles_radii() # in pixels
-            statistics = self.detector.calculate_radii_statistics()
-            df_data.append({"frame": frame_name,
-                            "centers": centers,
-                            "radii": radii,
-                            "statistic": statistics
-                            })
-        df = pd.DataFrame(df_data)
-        save_path = (self.path / f"data_{source}_{self.name}.pkl").resolve()
-        df.to_pickle(save_path)
+        self.frame_source.refresh() # the keys below need the current file identities, also of frames rewritten in place
+        if frame_step < 1: raise ValueError("frame_step must be at least 1")
+        all_frames, frames_list = frames_list, frames_list[::frame_step]
+        for artifact in set(artifacts) - {"data"}:
+            self._get_image_folder(artifact).mkdir(parents=True, exist_ok=True)
+        checkpoints_path = self._get_checkpoints_path(source)
+        if not resume and checkpoints_path.is_dir(): shutil.rmtree(checkpoints_path)
+        recover_measure_store(self._get_measure_store_path(source))
+        keys = self._get_artifacts_keys(frames_list, artifacts, engine, incremental, pyramid_scale)
+        stored_keys = {artifact: self._load_stored_keys(artifact, source) for artifact in artifacts}
+        pending = self._get_pending_frames(frames_list, artifacts, keys, stored_keys) if resume else list(frames_list)
+
+        def on_chunk(frame_names, records):
+            for artifact in set(artifacts) - {"data"}:
+                stored_keys[artifact].update((frame_name, keys[artifact][frame_name]) for frame_name in frame_names)
+                self._save_image_keys(artifact, stored_keys[artifact])
+            if "data" in artifacts and records:
+                for record in records:
+                    record["key"] = keys["data"][record["frame"]]
+                write_measure_store(records, checkpoints_path / f"part_{time.time_ns()}")
+
+        options = {"artifacts": tuple(artifacts), "bw_path": self.bw_path, "dot_path": self.dot_path,
+                   "incremental": incremental, "pyramid_scale": pyramid_scale}
+        if workers is None: workers = os.cpu_count() or 1
+        if isinstance(self.frame_source, MemmapFrameSource) and pending:
+            self.get_detector() # checks the stack was cropped with this configuration
+        if workers > 1 and pending:
+            self._process_frames_parallel(pending, workers, on_chunk, engine=engine, **options)
+        elif pending: # on headless detectors like the pool workers, the GUI detector decodes the frames in color
+            with tqdm(total=len(pending)) as progress:
+                for start in range(0, len(pending), CHECKPOINT_EVERY):
+                    chunk = pending[start:start + CHECKPOINT_EVERY]
+                    on_chunk(chunk, _process_frames_chunk(self.frame_source, chunk, self.configure, engine, dict(options, progress=progress)))
+        if "data" in artifacts:
+            if frame_step == 1:
+                self._consolidate_checkpoints(source, frames_list, resume)
+            else: # the sampled frames are added to the store, which keeps the frames it had
+                sampled = set(frames_list)
+                store_frames = [frame_name for frame_name in all_frames if frame_name in sampled or frame_name in stored_keys["data"]]
+                self._consolidate_checkpoints(source, store_frames, True)
+
+    def save_measure_data(self, source='local', workers=1, incremental=False, pyramid_scale=None, engine="hough", frame_step=1):
+        """Detect the disks in every frame (or every frame_step-th frame) and write the results as the measure store, see create_artifacts."""
+        self.create_artifacts(("data",), source=source, workers=workers, incremental=incremental, pyramid_scale=pyramid_scale, engine=engine,
+                              frame_step=frame_step)
+
+    def _get_measure_store_path(self, source: str) -> Path:
+        if source not in ["local", "drive", "manual"]:
+            raise ValueError("source must be either 'local', 'drive' or 'manual")
+        return (self.path / f"data_{source}_{self.name}").resolve()
+
+    def load_measure_store(self, source='local') -> MeasureStore:
+        """Open the columnar measure data, memory mapped.
+        A measure data pickled by an older version is converted to a store on first use.
+
+        Args:
+            source (str, optional): 'local', 'drive' or 'manual'. Defaults to 'local'.
 
+        Returns:
+            MeasureStore: centers, radii and statistics of every frame
+        """
+        store_path = self._get_measure_store_path(source)
+        recover_measure_store(store_path)
+        if not store_path.is_dir():
+            pickle_path = store_path.with_name(store_path.name + ".pkl")
+            if not pickle_path.is_file():
+                raise FileNotFoundError(f"Measure.load_measure_store() no measure data at {store_path}, run save_measure_data first.")
+            return write_measure_store(pd.read_pickle(pickle_path).to_dict("records"), store_path)
+        return MeasureStore(store_path)
 
     def load_measure_data(self, source='local'):
-        if source not in ["local", "drive", "manual"]:
-            raise ValueError("source must be either 'local', 'drive' or 'manual")
-        load_path = (self.path / f"data_{source}_{self.name}.pkl").resolve()
-        return pd.read_pickle(load_path)
+        """The measure data as a per-frame DataFrame (frame, centers, radii, statistic), see load_measure_store."""
+        return self.load_measure_store(source).to_dataframe()
+
+    def get_measure_store(self, source='local') -> MeasureStore:
+        """Shared measure store of the source, opened on first use, see load_measure_store."""
+        if source not in self.measure_stores:
+            self.measure_stores[source] = self.load_measure_store(source)
+        return self.measure_stores[source]
+
+    def get_measure_data(self, source='local') -> pd.DataFrame:
+        """Shared per-frame DataFrame of the source, built on first use, see load_measure_data."""
+        if source not in self.measure_data_frames:
+            self.measure_data_frames[source] = self.get_measure_store(source).to_dataframe()
+        return self.measure_data_frames[source]
+
+    def get_measure_statistics_table(self, source='local') -> np.ndarray:
+        """Per-frame radii statistics of the source, a table with a row per frame, see MeasureStore.get_statistics."""
+        return self.get_measure_store(source).get_statistics()
+
+    def _forget_measure_data(self, source: str):
+        # drop the shared copies (and their memory maps) before the store of the source is written again
+        self.measure_stores.pop(source, None)
+        self.measure_data_frames.pop(source, None)
 
 
@@ -1,10 +1,11 @@
 from openpiv import tools, pyprocess, validation, filters, scaling
+import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 from detection_lib import PIXEL_TO_MM_RATIO
 from measurements_detectors import Measure
-from project_tools import create_product_name
+from project_tools import create_product_name, select_frame_pairs
 
 
 class Piv:
@@ -24,9 +25,10 @@ class Piv:
     def product_name(self, first_frame_name, second_frame_name):
         return create_product_name(self.measure_name, first_frame_name, second_frame_name, self.source)
     
-    def calculate_two_frames_vector_field(self, first_frame_name, second_frame_name):
-        first_frame = tools.imread(f"{self.dot_path}/{first_frame_name}")
-        last_frame = tools.imread(f"{self.dot_path}/{second_frame_name}")
+    def calculate_two_frames_vector_field(self, first_frame_name, second_frame_name, first_frame=None, last_frame=None):
+        # the dot frames can be given already decoded (grayscale), see run_all_vector_fields
+        if first_frame is None: first_frame = tools.imread(f"{self.dot_path}/{first_frame_name}")
+        if last_frame is None: last_frame = tools.imread(f"{self.dot_path}/{second_frame_name}")
 
         winsize = 64 #32 # pixels, interrogation window size in frame A
         searchsize = 76 #38  # pixels, search area size in frame B
@@ -88,11 +90,23 @@ class Piv:
             show_invalid=False)
 
 
-    def run_all_vector_fields(self, source='local'):
+    def run_all_vector_fields(self, source='local', pair_selection=None):
+        """Calculate the vector field of the selected pairs of frames (i < j), every pair by default.
+
+        Args:
+            source (str, optional): 'local' or 'drive' frames. Defaults to 'local'.
+            pair_selection (dict, optional): keyword arguments of select_frame_pairs, such as
+                {"mode": "band", "max_lag": 10}. Defaults to None, every pair.
+        """
         if source == 'local': frame_names = self.measure.get_frame_names()
-        elif source == 'drive': frame_names = sorted(file.name for file in self.measure.get_drive_path().iterdir() if file.is_file() and file.suffix.lower() == '.jpg')
+        elif source == 'drive': frame_names = self.measure.get_drive_frame_names()
         else: raise ValueError("source must be either 'local' or 'drive'")
-        for i in tqdm(range(len(frame_names))):
-            for j in range(i+1, len(frame_names)):
-                first_frame_name, second_frame_name = frame_names[i], frame_names[j]
-                self.calculate_two_frames_vector_field(first_frame_name, second_frame_name)
+        second_frames = {} # first frame index -> indices of its second frames
+        for i, j in select_frame_pairs(len(frame_names), **(pair_selection or {})):
+            second_frames.setdefault(i, []).append(j)
+        for i in tqdm(sorted(second_frames)):
+            # the next dot frames are decoded in the background while PIV runs on the current pair
+            dot_frames = self.measure.iter_frames([frame_names[k] for k in [i] + second_frames[i]], cv2.IMREAD_GRAYSCALE, folder=self.dot_path)
+            first_frame_name, first_frame = next(dot_frames, (None, None))
+            for second_frame_name, last_frame in dot_frames:
+                self.calculate_two_frames_vector_field(first_frame_name, second_frame_name, first_frame, last_frame)
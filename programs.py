@@ -3,7 +3,11 @@ from piv_method import Piv
 from visualization import Plotter
 from calculator import Calculator
 from kdt_method import Kdt
+from detection_lib import Detector, DETECTION_ENGINES, SMALL_DISK_RADIUS, PIXEL_TO_MM_RATIO
+from scipy.spatial import KDTree
 from pathlib import Path
+import numpy as np
+import time
 
 def program1():
     m1 = Measure("23.01.25")
@@ -113,9 +117,47 @@ def test_detection(m: Measure, start=0, stop=2):
         detector.detect_disks(test_mode=True , show_control_print=False, print_stat=True)
 
 
+def benchmark_detection_engines(m: Measure, start=0, stop=10):
+    """Time the hough and blob detection engines on the same frames and report how well they agree.
+    A hough disk agrees if a blob disk is centered less than a small disk radius away from it."""
+    frame_names = m.get_frame_names()[start:stop]
+    if not frame_names:
+        raise ValueError(f"benchmark_detection_engines() no frames between {start} and {stop}.")
+    configure, frame_source = m.get_configure(), m.get_frame_source()
+    detectors = {engine: Detector(frame_source.get_path(), frame_names[0], configure, headless=True, engine=engine, frame_source=frame_source)
+                 for engine in DETECTION_ENGINES}
+    runtimes = {engine: 0.0 for engine in DETECTION_ENGINES}
+    agreements, center_offsets, radius_diffs = [], [], []
+    for frame in frame_names:
+        results = {}
+        for engine, detector in detectors.items():
+            detector.set_frame(frame)
+            start_time = time.perf_counter()
+            results[engine] = detector.detect_disks_headless()
+            runtimes[engine] += time.perf_counter() - start_time
+        (hough_centers, hough_radii), (blob_centers, blob_radii) = results["hough"], results["blob"]
+        if len(hough_centers) == 0 or len(blob_centers) == 0:
+            print(f"{frame}: hough {len(hough_centers)} disks, blob {len(blob_centers)} disks, nothing to compare")
+            continue
+        distances, indices = KDTree(blob_centers).query(hough_centers)
+        agree = distances < SMALL_DISK_RADIUS * PIXEL_TO_MM_RATIO
+        agreements.append(np.mean(agree))
+        if agree.any(): # the offsets of a frame with no agreeing disk are undefined
+            center_offsets.append(np.mean(distances[agree]))
+            radius_diffs.append(np.mean(np.abs(hough_radii[agree] - blob_radii[indices[agree]])))
+        print(f"{frame}: hough {len(hough_centers)} disks, blob {len(blob_centers)} disks, agreement {agreements[-1]:.2%}")
+    frames_num = len(frame_names)
+    for engine, runtime in runtimes.items():
+        print(f"{engine}: {runtime / frames_num:.3f} seconds per frame")
+    if agreements:
+        print(f"mean agreement: {np.mean(agreements):.2%}")
+    if center_offsets:
+        print(f"mean center offset: {np.mean(center_offsets):.2f} pixels")
+        print(f"mean radius difference: {np.mean(radius_diffs):.2f} pixels")
+
 def count_circles_detected():
     m = Measure("26.01.25", path_setting="drive")
-    data_m = m.load_measure_data(source='drive')
+    data_m = m.get_measure_data(source='drive')
     num = []
     total_num = m.get_total_frames_num()
     for i in range(total_num):
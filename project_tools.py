@@ -4,6 +4,7 @@ import os
 from pathlib import Path
 from tqdm import tqdm
 from detection_lib import Detector
+from frame_sources import FolderFrameSource, prefetch_frames
 from measurements_detectors import CONFIGURES
 
     
@@ -48,12 +49,13 @@ def count_disks_using_disk_num_sample():
 
 def create_clip(frames_source_path, output_path, video_name_without_extension, fps): 
     start_time = time.time()
-    frames = [name for name in os.listdir(frames_source_path) if os.path.isfile(os.path.join(frames_source_path, name))]
+    # skips the keys.json of saved bw and dot folders
+    frames = [name for name in os.listdir(frames_source_path) if os.path.isfile(os.path.join(frames_source_path, name)) and cv2.haveImageReader(os.path.join(frames_source_path, name))]
     frame_height, frame_width, _ =  cv2.imread(frames_source_path + frames[0], cv2.IMREAD_COLOR).shape
     fourcc = cv2.VideoWriter_fourcc(*'avc1')
     video = cv2.VideoWriter(f'{output_path}/{video_name_without_extension}.mp4', fourcc, fps, (frame_width, frame_height))
-    for frame_name in tqdm(frames):
-        frame = cv2.imread(frames_source_path + frame_name, cv2.IMREAD_COLOR)
+    # the next frames are decoded in the background while the current one is encoded
+    for frame_name, frame in tqdm(prefetch_frames(FolderFrameSource(frames_source_path), frames, cv2.IMREAD_COLOR), total=len(frames)):
         video.write(frame)
     video.release()
     end_time = time.time()
@@ -75,3 +77,43 @@ def create_product_name(measure_name: str, first_frame_name: str, second_frame_n
         str: name to save the data with
     """
     return f"{measure_name}_{first_frame_name[0:-4]}_{second_frame_name[0:-4]}_{source_name}"
+
+
+def select_frame_pairs(frames_num: int, mode: str = "all", max_lag: int = None, base_frame: int = 0, lags=None, pairs=None) -> list:
+    """select the frame pairs (i, j), i < j, to calculate vector fields for (see run_all_vector_fields of Kdt and Piv)
+    Every mode but "all" bounds the job to O(N * K) pairs instead of O(N^2).
+
+    Args:
+        frames_num (int): number of frames N, the pairs are indices into the frame names
+        mode (str, optional): "all" - every pair,
+            "band" - pairs at most max_lag frames apart (j - i <= max_lag),
+            "base" - base_frame with every later frame,
+            "lags" - pairs exactly a lag of lags apart (such as range(1, 100, 10)),
+            "explicit" - the given pairs.
+            Defaults to "all".
+        max_lag (int, optional): lag bound of "band". Defaults to None.
+        base_frame (int, optional): first frame of "base". Defaults to 0.
+        lags (iterable, optional): lags of "lags". Defaults to None.
+        pairs (iterable, optional): (i, j) pairs of "explicit", pairs out of range or with i >= j are dropped. Defaults to None.
+
+    Returns:
+        list: unique (i, j) pairs, sorted by j then i
+    """
+    # all, band and base are generated unique and in order
+    if mode == "all":
+        return [(i, j) for j in range(frames_num) for i in range(j)]
+    if mode == "band":
+        if max_lag is None or max_lag < 1: raise ValueError("select_frame_pairs() band mode needs max_lag >= 1.")
+        return [(i, j) for j in range(frames_num) for i in range(max(0, j - max_lag), j)]
+    if mode == "base":
+        if base_frame < 0: raise ValueError("select_frame_pairs() base mode needs base_frame >= 0.")
+        return [(base_frame, j) for j in range(base_frame + 1, frames_num)]
+    if mode == "lags":
+        if lags is None: raise ValueError("select_frame_pairs() lags mode needs lags.")
+        selected = ((j - lag, j) for j in range(frames_num) for lag in set(lags) if 0 < lag <= j)
+    elif mode == "explicit":
+        if pairs is None: raise ValueError("select_frame_pairs() explicit mode needs pairs.")
+        selected = ((int(i), int(j)) for i, j in pairs if 0 <= i < j < frames_num)
+    else:
+        raise ValueError(f"select_frame_pairs() unknown mode {mode}, must be one of 'all', 'band', 'base', 'lags', 'explicit'.")
+    return sorted(set(selected), key=lambda pair: (pair[1], pair[0]))
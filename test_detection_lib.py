@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+import pytest
+from detection_lib import Detector, Configuration, CenterDisk, ROI_ALIGNMENT, SMALL_DISK_RADIUS, LARGE_DISK_RADIUS, PIXEL_TO_MM_RATIO
+from frame_sources import FolderFrameSource
+
+
+def _write_disks_frame(folder, frame_name, seed, frame_shape=(720, 960)):
+    """Write a frame of white disks of both sizes on a noisy dark background."""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(0, 40, size=frame_shape, dtype=np.uint8)
+    small_radius, large_radius = SMALL_DISK_RADIUS * PIXEL_TO_MM_RATIO, LARGE_DISK_RADIUS * PIXEL_TO_MM_RATIO
+    centers = []
+    for _ in range(400):
+        radius = int(small_radius if rng.random() < 0.5 else large_radius)
+        x, y = rng.integers(radius, frame_shape[1] - radius), rng.integers(radius, frame_shape[0] - radius)
+        if all(np.hypot(x - cx, y - cy) > radius + cr + 4 for cx, cy, cr in centers):
+            centers.append((x, y, radius))
+            cv2.circle(frame, (int(x), int(y)), radius, 255, -1)
+    cv2.imwrite(str(folder / frame_name), frame)
+
+
+class _RecordingFrameSource(FolderFrameSource):
+    """Folder of frames that records the decodes made from it."""
+    def __init__(self, path):
+        super().__init__(path)
+        self.reads = []
+
+    def read(self, frame_name, flags=cv2.IMREAD_COLOR):
+        self.reads.append((frame_name, flags))
+        return super().read(frame_name, flags)
+
+
+def _full_frame_circles(detector):
+    """Detect on the whole masked frame, as the detector did before it cropped to the roi."""
+    keep_mask, outer_crop_center, outer_crop_radius = detector._create_outer_crop_mask()
+    cv2.circle(keep_mask, outer_crop_center, outer_crop_radius, 255, -1)
+    invert_mask, center_disk_center, center_disk_radius = detector._create_inner_mask()
+    cv2.circle(invert_mask, center_disk_center, int(center_disk_radius), 255, -1)
+    masked_gray_image = cv2.bitwise_xor(cv2.bitwise_and(detector._get_gray(), keep_mask), invert_mask)
+    black_white_image = cv2.threshold(masked_gray_image, detector.get_configure().get_mask_thresh(), 255, cv2.THRESH_BINARY)[1]
+    return detector._hough_circles(black_white_image)
+
+
+@pytest.mark.parametrize("seed, width_shift, height_shift", [(0, 0, 0), (1, 7, -5), (2, -13, 11), (3, 4, 29)])
+def test_roi_detection_matches_full_frame(tmp_path, seed, width_shift, height_shift):
+    _write_disks_frame(tmp_path, "DSC_0001.png", seed)
+    configure = Configuration(width_shift, height_shift, 2.4, 128, CenterDisk(6, 3, -2))
+    detector = Detector(tmp_path, "DSC_0001.png", configure, headless=True)
+    x0, y0 = detector.get_roi()[:2]
+    assert x0 % ROI_ALIGNMENT == 0 and y0 % ROI_ALIGNMENT == 0
+
+    centers, radii = detector.detect_disks_headless()
+    expected = _full_frame_circles(detector)
+    detected = np.column_stack([centers, radii])
+    assert sorted(map(tuple, detected.tolist())) == sorted(map(tuple, expected.tolist()))
+
+
+def test_pyramid_without_refine_skips_full_decode(tmp_path):
+    for seed, frame_name in enumerate(["DSC_0001.png", "DSC_0002.png"]):
+        _write_disks_frame(tmp_path, frame_name, seed)
+    frame_source = _RecordingFrameSource(tmp_path)
+    detector = Detector(tmp_path, "DSC_0001.png", Configuration(0, 0, 2.4, 128, CenterDisk(6, 3, -2)), headless=True, frame_source=frame_source)
+    detector.set_frame("DSC_0002.png")
+    frame_source.reads.clear()
+    coarse_centers, _ = detector.detect_disks_pyramid(scale=2, refine=False)
+    assert frame_source.reads == [("DSC_0002.png", cv2.IMREAD_REDUCED_GRAYSCALE_2)]
+
+    reference = Detector(tmp_path, "DSC_0002.png", detector.get_configure(), headless=True)
+    assert np.array_equal(coarse_centers, reference.detect_disks_pyramid(scale=2, refine=False)[0])
+    assert np.array_equal(detector.detect_disks_pyramid(scale=2)[0], reference.detect_disks_pyramid(scale=2)[0])
@@ -0,0 +1,66 @@
+import os
+import cv2
+import numpy as np
+from frame_sources import CachedFrameSource, FolderFrameSource
+
+
+def _write_frames(folder, frames_num, shape=(60, 80)):
+    """Write noisy grayscale jpg frames, a local folder standing in for the slow mount."""
+    folder.mkdir()
+    rng = np.random.default_rng(0)
+    frame_names = [f"DSC_{i:04d}.jpg" for i in range(1, frames_num + 1)]
+    for frame_name in frame_names:
+        cv2.imwrite(str(folder / frame_name), rng.integers(0, 256, size=shape, dtype=np.uint8))
+    return frame_names
+
+
+def _cached_names(cache_path):
+    return sorted(path.name for path in cache_path.iterdir())
+
+
+def test_cached_reads_match_source(tmp_path):
+    frame_names = _write_frames(tmp_path / "mount", 4)
+    source = FolderFrameSource(tmp_path / "mount")
+    cached = CachedFrameSource(source, tmp_path / "cache", size_limit=10**9)
+    try:
+        for frame_name in frame_names:
+            assert np.array_equal(cached.read(frame_name, cv2.IMREAD_GRAYSCALE), source.read(frame_name, cv2.IMREAD_GRAYSCALE))
+        cached.release()
+        assert _cached_names(tmp_path / "cache") == frame_names
+        for frame_name in frame_names:
+            assert (tmp_path / "cache" / frame_name).read_bytes() == (tmp_path / "mount" / frame_name).read_bytes()
+    finally:
+        cached.release()
+
+
+def test_cache_evicts_least_recently_read(tmp_path):
+    frame_names = _write_frames(tmp_path / "mount", 3)
+    sizes = [(tmp_path / "mount" / frame_name).stat().st_size for frame_name in frame_names]
+    cached = CachedFrameSource(FolderFrameSource(tmp_path / "mount"), tmp_path / "cache", size_limit=sum(sizes) - 1, prefetch_frames=0)
+    try:
+        for frame_name in frame_names:
+            cached.read(frame_name)
+        assert _cached_names(tmp_path / "cache") == frame_names[1:]
+        cached.read(frame_names[1])
+        cached.read(frame_names[0])
+        assert _cached_names(tmp_path / "cache") == frame_names[:2]
+    finally:
+        cached.release()
+
+
+def test_cache_copies_changed_frames_again(tmp_path):
+    frame_names = _write_frames(tmp_path / "mount", 2)
+    cached = CachedFrameSource(FolderFrameSource(tmp_path / "mount"), tmp_path / "cache", size_limit=10**9, prefetch_frames=0)
+    try:
+        cached.read(frame_names[0])
+        # a new size
+        changed = np.full((30, 40), 200, dtype=np.uint8)
+        cv2.imwrite(str(tmp_path / "mount" / frame_names[0]), changed)
+        assert cached.read(frame_names[0], cv2.IMREAD_GRAYSCALE).shape == changed.shape
+        # a new modification time alone
+        stat = (tmp_path / "mount" / frame_names[0]).stat()
+        os.utime(tmp_path / "mount" / frame_names[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        cached.read(frame_names[0])
+        assert (tmp_path / "cache" / frame_names[0]).stat().st_mtime_ns == stat.st_mtime_ns + 10**9
+    finally:
+        cached.release()
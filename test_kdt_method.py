@@ -0,0 +1,102 @@
+import time
+import numpy as np
+import pytest
+from scipy.spatial import KDTree
+from kdt_method import Kdt, MAX_SINGLE_DISPLACEMENT, _save_vector_fields, _group_pairs, _link_frames, _assignment_matches
+from project_tools import select_frame_pairs
+from measure_store import write_measure_store, STATISTICS_DTYPE
+
+
+class _StoreMeasure:
+    """The parts of a Measure a Kdt reads, over a measure store written by the test."""
+    def __init__(self, store, vector_field_path=None):
+        self.store = store
+        self.vector_field_path = vector_field_path
+
+    def get_name(self):
+        return "test"
+
+    def get_vector_field_path(self):
+        return self.vector_field_path
+
+    def get_measure_store(self, source='local'):
+        return self.store
+
+    def get_frame_center(self):
+        return (0, 0)
+
+
+def _write_random_walk(path, seed, frames_num=40, particles_num=600):
+    """Particles walking with births and deaths, at the integer or half integer centers HoughCircles gives."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0, 1200, (particles_num, 2))
+    statistic = {name: 0 for name in STATISTICS_DTYPE.names}
+    records = []
+    for f in range(frames_num):
+        positions = positions + rng.normal(0, 6, positions.shape)
+        positions = np.vstack([positions[rng.random(len(positions)) > 0.02], rng.uniform(0, 1200, (12, 2))])
+        centers = np.round(positions * 2) / 2
+        records.append({"frame": f"DSC_{f:04d}.jpg", "centers": centers[rng.permutation(len(centers))],
+                        "radii": np.ones(len(centers)), "statistic": statistic})
+    return write_measure_store(records, path)
+
+
+def _loop_trajectories(centers_arrays):
+    """The per particle mutual nearest neighbour loop build_trajectories_robust replaced."""
+    mean_center = np.mean(np.concatenate(centers_arrays), axis=0, dtype=np.float64)
+    trajectories = [centers_arrays[0] - mean_center]
+    for frame_idx in range(1, len(centers_arrays)):
+        prev_particles = trajectories[-1]
+        curr_particles = centers_arrays[frame_idx] - mean_center
+        if len(prev_particles) == 0 or len(curr_particles) == 0:
+            trajectories.append(curr_particles)
+            continue
+        dist_forward, idx_forward = KDTree(curr_particles).query(prev_particles)
+        dist_backward, idx_backward = KDTree(prev_particles).query(curr_particles)
+        mutual_matches = np.zeros(len(prev_particles), dtype=bool)
+        for i, (valid, curr_idx) in enumerate(zip(dist_forward < MAX_SINGLE_DISPLACEMENT, idx_forward)):
+            if valid and idx_backward[curr_idx] == i and dist_backward[curr_idx] < MAX_SINGLE_DISPLACEMENT:
+                mutual_matches[i] = True
+        new_positions = prev_particles.copy()
+        new_positions[mutual_matches] = curr_particles[idx_forward[mutual_matches]]
+        unmatched_curr = np.setdiff1d(np.arange(len(curr_particles)), idx_forward[mutual_matches])
+        trajectories.append(np.vstack([new_positions, curr_particles[unmatched_curr]]))
+    result = np.zeros((len(trajectories), max(len(traj) for traj in trajectories), 2))
+    for i, traj in enumerate(trajectories):
+        result[i, :len(traj)] = traj
+    return result
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_build_trajectories_robust_matches_loop(tmp_path, seed):
+    store = _write_random_walk(tmp_path / "store", seed)
+    trajectories = Kdt(_StoreMeasure(store)).build_trajectories_robust()
+    expected = _loop_trajectories(store.get_frames_centers())
+    assert trajectories.shape == expected.shape
+    assert np.array_equal(trajectories, expected)
+
+
+def test_batched_vector_fields_match_pairs(tmp_path):
+    store = _write_random_walk(tmp_path / "store", 0, frames_num=12)
+    frame_names = store.get_frame_names()
+    (tmp_path / "batched").mkdir()
+    (tmp_path / "pairs").mkdir()
+    _save_vector_fields(store, frame_names, _group_pairs(select_frame_pairs(len(frame_names))), tmp_path / "batched", "test", "Kdt")
+    kdt = Kdt(_StoreMeasure(store, tmp_path / "pairs"))
+    for i, j in select_frame_pairs(len(frame_names)):
+        kdt.save_vector_field(frame_names[i], frame_names[j])
+    pair_files = sorted(path.name for path in (tmp_path / "pairs").iterdir())
+    assert pair_files == sorted(path.name for path in (tmp_path / "batched").iterdir())
+    for name in pair_files:
+        assert (tmp_path / "batched" / name).read_text() == (tmp_path / "pairs" / name).read_text()
+
+
+def test_assignment_linking_of_inflating_lattice_is_fast():
+    # an exact lattice under an inflation gives large components of equal distances, which stalled a sparse solver
+    lattice = np.stack(np.meshgrid(np.arange(80), np.arange(80)), axis=-1).reshape(-1, 2) * 80.0
+    frames = [lattice * (1 + 0.012 * f) for f in range(0, 60, 10)]
+    start_time = time.perf_counter()
+    indices = _link_frames(frames, _assignment_matches, predict=True)
+    assert time.perf_counter() - start_time < 10
+    for f, centers in enumerate(frames):
+        assert np.array_equal(np.sort(indices[f][indices[f] >= 0]), np.arange(len(centers)))
@@ -0,0 +1,33 @@
+import numpy as np
+from measure_store import write_measure_store, recover_measure_store, MeasureStore, STATISTICS_DTYPE, STORE_NEXT_SUFFIX, STORE_REPLACED_SUFFIX
+
+
+def _records(frames_num, particles_num):
+    statistic = {name: 0 for name in STATISTICS_DTYPE.names}
+    return [{"frame": f"DSC_{f:04d}.jpg", "centers": np.full((particles_num, 2), f), "radii": np.ones(particles_num), "statistic": statistic}
+            for f in range(frames_num)]
+
+
+def test_write_replaces_store(tmp_path):
+    path = tmp_path / "store"
+    write_measure_store(_records(3, 5), path)
+    store = write_measure_store(_records(4, 2), path)
+    assert store.get_frame_names() == [f"DSC_{f:04d}.jpg" for f in range(4)]
+    assert len(store.get_all_radii()) == 8
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["store"]
+
+
+def test_recover_interrupted_swap(tmp_path):
+    path = tmp_path / "store"
+    write_measure_store(_records(3, 5), tmp_path / ("store" + STORE_REPLACED_SUFFIX))
+    write_measure_store(_records(4, 2), tmp_path / ("store" + STORE_NEXT_SUFFIX))
+    recover_measure_store(path)
+    assert len(MeasureStore(path)) == 4
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["store"]
+
+
+def test_recover_keeps_replaced_store_without_next(tmp_path):
+    path = tmp_path / "store"
+    write_measure_store(_records(3, 5), tmp_path / ("store" + STORE_REPLACED_SUFFIX))
+    recover_measure_store(path)
+    assert len(MeasureStore(path)) == 3
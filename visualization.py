@@ -27,15 +27,20 @@ class Plotter:
             data = data[mask]            
         return {col: data[col].to_numpy() for col in data.columns}
 
-    def _plot_displacement_by_rings_helper(self, ax: plt.Axes, measure_statistics, first_frame_num, second_frame_num):
+    def _plot_displacement_by_rings_helper(self, ax: plt.Axes, measure_store, first_frame_name, second_frame_name):
         ax.axhline(y=0, color='gray', linestyle='--', linewidth=0.5)
         ax.axhline(y=SMALL_DISK_RADIUS, color='gray', linestyle='--', linewidth=0.5)
         ax.axhline(y=-SMALL_DISK_RADIUS, color='gray', linestyle='--', linewidth=0.5)
         ax.axhline(y=LARGE_DISK_RADIUS, color='gray', linestyle='--', linewidth=0.5)
         ax.axhline(y=-LARGE_DISK_RADIUS, color='gray', linestyle='--', linewidth=0.5)
         # extra_data = self.measure.get_measure_statistics()
-        stat_f1, stat_f2 = measure_statistics[int(first_frame_num)], measure_statistics[int(second_frame_num)]
-        area_fraction_str = f"area fraction: {round(0.5*(stat_f1['areal_fraction'] + stat_f2['areal_fraction']), 2)} %"
+        # rows are looked up by frame name, a store detected every few frames (frame_step) lacks the other frames
+        frame_names = [name for name in (first_frame_name, second_frame_name) if name in measure_store.get_frame_names()]
+        if frame_names:
+            areal_fraction = np.mean([measure_store.get_statistic(name)['areal_fraction'] for name in frame_names])
+            area_fraction_str = f"area fraction: {round(areal_fraction, 2)} %"
+        else:
+            area_fraction_str = "area fraction: not detected"
         ax.plot([], [], alpha=0, label=area_fraction_str)
         ax.legend()
         ax.set_xlabel("radius [mm]")
@@ -43,7 +48,7 @@ class Plotter:
         return ax
     
 
-    def plot_displacement_by_rings(self, ax: plt.Axes, measure_statistics, first_frame_name, second_frame_name, radii, rad_disp, tan_disp, save=False, show=True):
+    def plot_displacement_by_rings(self, ax: plt.Axes, measure_store, first_frame_name, second_frame_name, radii, rad_disp, tan_disp, save=False, show=True):
         # product_name = self.product_name(first_frame_name, second_frame_name)
         # fig, ax = plt.subplots()
         rad_disp_mm, tan_disp_mm = rad_disp / PIXEL_TO_MM_RATIO, tan_disp / PIXEL_TO_MM_RATIO  # Convert to mm
@@ -53,7 +58,7 @@ class Plotter:
         ax.scatter(radii, tan_disp_mm, linewidths=0.5, marker=".", alpha=0.5, color="green", label=r"$\hat{\theta}$")
         ax.plot(radii, tan_disp_mm, color="green", label=r"$\hat{\theta}$")
         ax.set_title(f"displacement field of: {first_frame_num} & {second_frame_num}", pad=15)
-        ax = self._plot_displacement_by_rings_helper(ax, measure_statistics, first_frame_num, second_frame_num)
+        ax = self._plot_displacement_by_rings_helper(ax, measure_store, first_frame_name, second_frame_name)
         # if save: plt.savefig(f"{str(self.graph_path)}/disp_{product_name}.png")
         # if show: plt.show()
         return ax